@@ -1,16 +1,69 @@
-from google import genai
+from typing import List, Optional
 from google.genai import types
-import sys
-import os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import GOOGLE_API_KEY, MODEL_NAME
-from models import (
+import asyncio
+from contextlib import nullcontext
+from aiolimiter import AsyncLimiter
+from ..config import (
+    MODEL_NAME,
+    EXPLANATION_CONTEXT_TOKENS,
+    EXPLANATION_BASE_TOKENS,
+    EXPLANATION_TOKENS_PER_TOPIC,
+    THINKING_BUDGET
+)
+from ..client import client, call_model
+from ..models import (
     DocumentExplanations,
-    TopicExplanation,
+    DocumentExplanationsSchema,
     DocumentStructure,
     HighlightedDocument
 )
-import json
+from ..document_processor import (
+    PageContent,
+    format_structure_for_agent,
+    excerpt_for_topics,
+    truncate_to_tokens
+)
+from ..cache import make_cache_key, check_cache, save_to_cache
+import orjson
+
+
+# Bump whenever the prompt changes so cached responses are invalidated
+PROMPT_VERSION = 4
+
+# Static prompt sections, built once at import time
+_PROMPT_HEADER = """You are an Explanation Agent. Your task is to create educational explanations that help learners understand the topics in this document and their learning pathway."""
+
+_PROMPT_INSTRUCTIONS = """INSTRUCTIONS:
+1. Create an overarching explanation that introduces what this document teaches (NOT a summary)
+2. For each main topic, create an explanation that:
+   - Explains what the learner will understand after studying this topic
+   - Lists prerequisite concepts needed to understand this topic
+   - Suggests next steps for deeper learning
+   - Identifies related topics in the document
+3. Focus on learning pathways, not content summaries
+
+Return a JSON object with this structure:
+{
+  "overarching_explanation": "This document will help you understand... By studying this material, you will be able to...",
+  "topic_explanations": [
+    {
+      "topic_id": "topic_1",
+      "topic_title": "Topic Title",
+      "explanation": "After studying this topic, you will understand... This is important because...",
+      "prerequisite_concepts": ["Concept 1", "Concept 2"],
+      "next_steps": ["Study topic X", "Practice with examples", "Explore advanced application Y"],
+      "related_topics": ["topic_2", "topic_3"]
+    }
+  ]
+}
+
+Guidelines:
+- DO NOT summarize the document content
+- Focus on learning outcomes and pathways
+- Be encouraging and educational
+- Connect topics to show the learning journey
+- Keep explanations concise but informative (2-4 sentences per topic)
+"""
 
 
 class ExplanationAgent:
@@ -19,16 +72,30 @@ class ExplanationAgent:
     users understand learning pathways and connections.
     """
     
-    def __init__(self):
-        """Initialize the Explanation Agent with Google ADK"""
-        self.client = genai.Client(api_key=GOOGLE_API_KEY)
+    def __init__(
+        self,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        rate_limiter: Optional[AsyncLimiter] = None
+    ):
+        """
+        Initialize the Explanation Agent with Google ADK
+        
+        Args:
+            semaphore: Shared cap on in-flight model requests
+            rate_limiter: Shared requests-per-minute limiter
+        """
+        self.client = client
         self.model_name = MODEL_NAME
+        self._semaphore = semaphore or nullcontext()
+        self._rate_limiter = rate_limiter or nullcontext()
         
     async def generate_explanations(
         self,
         document: str,
         structure: DocumentStructure,
-        highlights: HighlightedDocument
+        highlights: HighlightedDocument,
+        topics_json: Optional[str] = None,
+        pages: Optional[List[PageContent]] = None
     ) -> DocumentExplanations:
         """
         Generate explanations for the document and its topics.
@@ -37,61 +104,86 @@ class ExplanationAgent:
             document: Full document text
             structure: Document structure from StructurizationAgent
             highlights: Highlighted sections from HighlighterAgent
+            topics_json: Pre-serialized structure from format_structure_for_agent
+            pages: Page contents, used to excerpt the introduction and the
+                opening page of each topic instead of the document head
             
         Returns:
             DocumentExplanations with overarching and topic-specific explanations
         """
         
-        prompt = self._create_explanation_prompt(document, structure, highlights)
+        if topics_json is None:
+            topics_json = format_structure_for_agent(structure)
         
-        response = await self.client.aio.models.generate_content(
-            model=self.model_name,
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                temperature=0.6,
-                response_mime_type="application/json",
-            )
+        prompt = self._create_explanation_prompt(
+            self._create_excerpt(document, structure, pages),
+            topics_json,
+            highlights
         )
         
-        explanations_data = json.loads(response.text)
+        config = self._create_generation_config(len(structure.topics))
+        cache_key = make_cache_key(prompt, self.model_name, PROMPT_VERSION, config)
+        text = await check_cache(cache_key)
+        if text is not None:
+            return self._parse_response(text)
         
-        topic_explanations = []
-        for exp_data in explanations_data.get("topic_explanations", []):
-            topic_explanations.append(TopicExplanation(
-                topic_id=exp_data["topic_id"],
-                topic_title=exp_data["topic_title"],
-                explanation=exp_data["explanation"],
-                prerequisite_concepts=exp_data.get("prerequisite_concepts", []),
-                next_steps=exp_data.get("next_steps", []),
-                related_topics=exp_data.get("related_topics", [])
-            ))
+        async with self._semaphore, self._rate_limiter:
+            response = await call_model(
+                self.client,
+                model=self.model_name,
+                contents=prompt,
+                config=config
+            )
         
-        return DocumentExplanations(
-            overarching_explanation=explanations_data.get("overarching_explanation", ""),
-            topic_explanations=topic_explanations
-        )
+        # The SDK decodes schema-constrained output into the model for us
+        result = response.parsed
+        if result is None:
+            result = self._parse_response(response.text)
+        await save_to_cache(cache_key, response.text)
+        return result
     
-    def _create_explanation_prompt(
+    def _create_excerpt(
         self,
         document: str,
         structure: DocumentStructure,
+        pages: Optional[List[PageContent]]
+    ) -> str:
+        """Fit the document context for the prompt to the token budget"""
+        
+        if pages:
+            return excerpt_for_topics(pages, structure, EXPLANATION_CONTEXT_TOKENS)
+        return truncate_to_tokens(document, EXPLANATION_CONTEXT_TOKENS)
+    
+    def _create_generation_config(self, num_topics: int) -> types.GenerateContentConfig:
+        """Create the generation config used for explanation requests"""
+        
+        return types.GenerateContentConfig(
+            temperature=0.6,
+            max_output_tokens=(
+                THINKING_BUDGET
+                + EXPLANATION_BASE_TOKENS
+                + EXPLANATION_TOKENS_PER_TOPIC * num_topics
+            ),
+            thinking_config=types.ThinkingConfig(thinking_budget=THINKING_BUDGET),
+            response_mime_type="application/json",
+            response_schema=DocumentExplanationsSchema,
+        )
+    
+    def _parse_response(self, text: str) -> DocumentExplanations:
+        """Parse the raw JSON model response into DocumentExplanations"""
+        
+        # Decode and validate in one pass inside pydantic-core
+        return DocumentExplanations.model_validate_json(text)
+    
+    def _create_explanation_prompt(
+        self,
+        excerpt: str,
+        topics_json: str,
         highlights: HighlightedDocument
     ) -> str:
         """Create the prompt for explanation generation"""
         
-        structure_json = json.dumps({
-            "document_title": structure.document_title,
-            "topics": [
-                {
-                    "id": topic.id,
-                    "title": topic.title,
-                    "subtopics": [{"id": st.id, "title": st.title} for st in topic.subtopics]
-                }
-                for topic in structure.topics
-            ]
-        }, indent=2)
-        
-        highlights_json = json.dumps([
+        highlights_json = orjson.dumps([
             {
                 "page": h.page_number,
                 "text": h.text[:100] + "...",
@@ -99,47 +191,13 @@ class ExplanationAgent:
                 "importance": h.importance
             }
             for h in highlights.highlights[:20]  # Sample of highlights
-        ], indent=2)
+        ], option=orjson.OPT_INDENT_2).decode()
         
-        return f"""You are an Explanation Agent. Your task is to create educational explanations that help learners understand the topics in this document and their learning pathway.
-
-DOCUMENT:
-{document[:3000]}...  [Document truncated for context]
-
-DOCUMENT STRUCTURE:
-{structure_json}
-
-KEY HIGHLIGHTS (sample):
-{highlights_json}
-
-INSTRUCTIONS:
-1. Create an overarching explanation that introduces what this document teaches (NOT a summary)
-2. For each main topic, create an explanation that:
-   - Explains what the learner will understand after studying this topic
-   - Lists prerequisite concepts needed to understand this topic
-   - Suggests next steps for deeper learning
-   - Identifies related topics in the document
-3. Focus on learning pathways, not content summaries
-
-Return a JSON object with this structure:
-{{
-  "overarching_explanation": "This document will help you understand... By studying this material, you will be able to...",
-  "topic_explanations": [
-    {{
-      "topic_id": "topic_1",
-      "topic_title": "Topic Title",
-      "explanation": "After studying this topic, you will understand... This is important because...",
-      "prerequisite_concepts": ["Concept 1", "Concept 2"],
-      "next_steps": ["Study topic X", "Practice with examples", "Explore advanced application Y"],
-      "related_topics": ["topic_2", "topic_3"]
-    }}
-  ]
-}}
-
-Guidelines:
-- DO NOT summarize the document content
-- Focus on learning outcomes and pathways
-- Be encouraging and educational
-- Connect topics to show the learning journey
-- Keep explanations concise but informative (2-4 sentences per topic)
-"""
+        return (
+            f"{_PROMPT_HEADER}\n\n"
+            f"DOCUMENT EXCERPT:\n{excerpt}\n"
+            "[Excerpt: document introduction and the opening page of each topic]\n\n"
+            f"DOCUMENT STRUCTURE:\n{topics_json}\n\n"
+            f"KEY HIGHLIGHTS (sample):\n{highlights_json}\n\n"
+            f"{_PROMPT_INSTRUCTIONS}"
+        )
@@ -1,13 +1,49 @@
-from typing import List
-from google import genai
+from typing import AsyncIterator, List, Optional
 from google.genai import types
-import sys
-import os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import GOOGLE_API_KEY, MODEL_NAME
-from models import HighlightedDocument, PageHighlight, DocumentStructure
-from document_processor import PageContent
-import json
+import asyncio
+from contextlib import nullcontext
+from aiolimiter import AsyncLimiter
+from ..config import MODEL_NAME, HIGHLIGHT_MAX_OUTPUT_TOKENS, HIGHLIGHT_MAX_REQUEST_TOKENS
+from ..client import client, open_model_stream
+from ..models import HighlightedDocument, HighlightResponse, HighlightResponseSchema, PageHighlight, DocumentStructure
+from ..document_processor import PageContent, format_pages, format_structure_for_agent, group_pages
+from ..cache import make_cache_key, check_cache, save_to_cache
+import ijson
+
+
+# Bump whenever the prompt changes so cached responses are invalidated
+PROMPT_VERSION = 5
+
+# Static prompt sections, built once at import time
+_PROMPT_HEADER = """You are a Text Highlighting Agent. Your task is to identify and mark the most important sections in a document based on its topic structure."""
+
+_PROMPT_INSTRUCTIONS = """INSTRUCTIONS:
+1. For each topic and subtopic covered by this text, identify its key sections
+2. Mark the beginning and important sections of each topic
+3. Provide character positions (start_char, end_char) relative to each page
+4. Assign importance levels: "high" (core concepts), "medium" (supporting details), "low" (examples/references)
+5. Link each highlight to a topic_id from the structure
+
+Return a JSON object with this structure:
+{
+  "highlights": [
+    {
+      "page_number": 1,
+      "start_char": 0,
+      "end_char": 100,
+      "text": "excerpt of highlighted text",
+      "topic_id": "topic_id_from_structure",
+      "importance": "high"
+    }
+  ]
+}
+
+Focus on highlighting:
+- Topic introductions and definitions
+- Key theorems, formulas, or principles
+- Important examples
+- Section transitions
+"""
 
 
 class HighlighterAgent:
@@ -16,102 +52,205 @@ class HighlighterAgent:
     of the document based on the document structure.
     """
     
-    def __init__(self):
-        """Initialize the Text Highlighter Agent with Google ADK"""
-        self.client = genai.Client(api_key=GOOGLE_API_KEY)
+    def __init__(
+        self,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        rate_limiter: Optional[AsyncLimiter] = None
+    ):
+        """
+        Initialize the Text Highlighter Agent with Google ADK
+        
+        Args:
+            semaphore: Shared cap on in-flight model requests
+            rate_limiter: Shared requests-per-minute limiter
+        """
+        self.client = client
         self.model_name = MODEL_NAME
+        self._semaphore = semaphore or nullcontext()
+        self._rate_limiter = rate_limiter or nullcontext()
         
     async def highlight_document(
         self,
         document: str,
         structure: DocumentStructure,
-        pages: List[PageContent]
+        pages: List[PageContent],
+        topics_json: Optional[str] = None
     ) -> HighlightedDocument:
         """
         Identify and highlight important sections in the document.
         
+        Pages are highlighted in groups of HIGHLIGHT_PAGES_PER_REQUEST, one
+        request per group, and the requests run concurrently. Character
+        offsets are page-local, so the results can be concatenated as-is.
+        
         Args:
             document: Full document text with page markers
             structure: Document structure from StructurizationAgent
             pages: List of page contents
+            topics_json: Pre-serialized structure from format_structure_for_agent
             
         Returns:
             HighlightedDocument with all highlights
         """
         
-        prompt = self._create_highlight_prompt(document, structure)
+        if topics_json is None:
+            topics_json = format_structure_for_agent(structure)
         
-        response = await self.client.aio.models.generate_content(
-            model=self.model_name,
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                temperature=0.3,
-                response_mime_type="application/json",
-            )
+        page_highlights = await asyncio.gather(*[
+            self._highlight_pages(page_group, structure, topics_json)
+            for page_group in group_pages(pages)
+        ])
+        highlights = [h for highlights in page_highlights for h in highlights]
+        
+        return HighlightedDocument(
+            highlights=highlights,
+            total_pages=len(pages)
         )
+    
+    async def stream_document_highlights(
+        self,
+        structure: DocumentStructure,
+        pages: List[PageContent],
+        topics_json: Optional[str] = None
+    ) -> AsyncIterator[PageHighlight]:
+        """
+        Stream highlights for the whole document, one page group at a time.
+        
+        Uses the same page groups as highlight_document, with the requests
+        running concurrently; each group's highlights are yielded as soon as
+        that group's request completes. Requests still running when the
+        consumer stops iterating are cancelled.
+        
+        Args:
+            structure: Document structure from StructurizationAgent
+            pages: List of page contents
+            topics_json: Pre-serialized structure from format_structure_for_agent
+        
+        Yields:
+            Each PageHighlight, grouped by the request that produced it
+        """
+        
+        if topics_json is None:
+            topics_json = format_structure_for_agent(structure)
+        
+        tasks = [
+            asyncio.create_task(self._highlight_pages(page_group, structure, topics_json))
+            for page_group in group_pages(pages)
+        ]
+        try:
+            for next_group in asyncio.as_completed(tasks):
+                for highlight in await next_group:
+                    yield highlight
+        finally:
+            # Stop billing model calls once the consumer has gone away
+            for task in tasks:
+                task.cancel()
+    
+    async def stream_highlights(
+        self,
+        document: str,
+        structure: DocumentStructure,
+        topics_json: Optional[str] = None,
+        num_pages: int = 1
+    ) -> AsyncIterator[PageHighlight]:
+        """
+        Stream highlights as the model generates them.
+        
+        Args:
+            document: Full document text with page markers
+            structure: Document structure from StructurizationAgent
+            topics_json: Pre-serialized structure from format_structure_for_agent
+            num_pages: Number of pages in the document, used to size the output cap
+            
+        Yields:
+            Each PageHighlight as soon as it has been fully received
+        """
+        
+        if topics_json is None:
+            topics_json = format_structure_for_agent(structure)
+        
+        prompt = self._create_highlight_prompt(document, topics_json)
+        
+        config = self._create_generation_config(num_pages)
+        cache_key = make_cache_key(prompt, self.model_name, PROMPT_VERSION, config)
+        text = await check_cache(cache_key)
+        if text is not None:
+            for highlight in HighlightResponse.model_validate_json(text).highlights:
+                yield highlight
+            return
+        
+        # Hold the request slot until the stream has been fully received
+        async with self._semaphore, self._rate_limiter:
+            stream = await open_model_stream(
+                self.client,
+                model=self.model_name,
+                contents=prompt,
+                config=config
+            )
+            
+            # Feed chunks into an incremental parser so highlights can be
+            # yielded while the rest of the response is still generating
+            parsed = ijson.sendable_list()
+            parser = ijson.items_coro(parsed, "highlights.item")
+            received = []
+            
+            async for chunk in stream:
+                if not chunk.text:
+                    continue
+                received.append(chunk.text)
+                parser.send(chunk.text.encode("utf-8"))
+                for h in parsed:
+                    yield PageHighlight.model_validate(h)
+                del parsed[:]
+            
+            parser.close()
+            for h in parsed:
+                yield PageHighlight.model_validate(h)
         
-        highlights_data = json.loads(response.text)
+        await save_to_cache(cache_key, "".join(received))
+    
+    async def _highlight_pages(
+        self,
+        pages: List[PageContent],
+        structure: DocumentStructure,
+        topics_json: str
+    ) -> List[PageHighlight]:
+        """Highlight a group of pages against the full topic structure"""
         
-        highlights = []
-        for h in highlights_data.get("highlights", []):
-            highlights.append(PageHighlight(
-                page_number=h["page_number"],
-                start_char=h["start_char"],
-                end_char=h["end_char"],
-                text=h["text"],
-                topic_id=h["topic_id"],
-                importance=h["importance"]
-            ))
+        document = format_pages(pages)
+        return [
+            highlight async for highlight in self.stream_highlights(
+                document, structure, topics_json, len(pages)
+            )
+        ]
+    
+    def _create_generation_config(self, num_pages: int = 1) -> types.GenerateContentConfig:
+        """Create the generation config used for highlight requests"""
+        
+        return types.GenerateContentConfig(
+            # Extraction task: deterministic output, no thinking needed
+            temperature=0.0,
+            max_output_tokens=min(
+                HIGHLIGHT_MAX_OUTPUT_TOKENS * num_pages,
+                HIGHLIGHT_MAX_REQUEST_TOKENS
+            ),
+            thinking_config=types.ThinkingConfig(thinking_budget=0),
+            response_mime_type="application/json",
+            response_schema=HighlightResponseSchema,
+        )
+    
+    def _parse_response(self, text: str, total_pages: int) -> HighlightedDocument:
+        """Parse the raw JSON model response into a HighlightedDocument"""
+        
+        # Decode and validate in one pass inside pydantic-core
+        response = HighlightResponse.model_validate_json(text)
         
         return HighlightedDocument(
-            highlights=highlights,
-            total_pages=len(pages)
+            highlights=response.highlights,
+            total_pages=total_pages
         )
     
-    def _create_highlight_prompt(self, document: str, structure: DocumentStructure) -> str:
+    def _create_highlight_prompt(self, document: str, topics_json: str) -> str:
         """Create the prompt for highlighting"""
         
-        topics_json = json.dumps([
-            {
-                "id": topic.id,
-                "title": topic.title,
-                "subtopics": [{"id": st.id, "title": st.title} for st in topic.subtopics]
-            }
-            for topic in structure.topics
-        ], indent=2)
-        
-        return f"""You are a Text Highlighting Agent. Your task is to identify and mark the most important sections in a document based on its topic structure.
-
-DOCUMENT:
-{document}
-
-TOPIC STRUCTURE:
-{topics_json}
-
-INSTRUCTIONS:
-1. For each topic and subtopic, identify the key sections in the document
-2. Mark the beginning and important sections of each topic
-3. Provide character positions (start_char, end_char) relative to each page
-4. Assign importance levels: "high" (core concepts), "medium" (supporting details), "low" (examples/references)
-5. Link each highlight to a topic_id from the structure
-
-Return a JSON object with this structure:
-{{
-  "highlights": [
-    {{
-      "page_number": 1,
-      "start_char": 0,
-      "end_char": 100,
-      "text": "excerpt of highlighted text",
-      "topic_id": "topic_id_from_structure",
-      "importance": "high"
-    }}
-  ]
-}}
-
-Focus on highlighting:
-- Topic introductions and definitions
-- Key theorems, formulas, or principles
-- Important examples
-- Section transitions
-"""
+        return f"{_PROMPT_HEADER}\n\nDOCUMENT:\n{document}\n\nTOPIC STRUCTURE:\n{topics_json}\n\n{_PROMPT_INSTRUCTIONS}"
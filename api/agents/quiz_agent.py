@@ -1,12 +1,82 @@
-from google import genai
+from typing import AsyncIterator, Awaitable, List, Optional, Tuple
 from google.genai import types
-import sys
-import os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import GOOGLE_API_KEY, MODEL_NAME
-from models import Quiz, QuizQuestion, QuizChoice, DocumentStructure
-import json
-import uuid
+import asyncio
+from contextlib import nullcontext
+from aiolimiter import AsyncLimiter
+from ..config import MODEL_NAME, QUIZ_MAX_OUTPUT_TOKENS, QUIZ_QUESTION_ATTEMPTS, THINKING_BUDGET
+from ..client import client, call_model
+from ..models import Quiz, QuizQuestion, QuizQuestionSchema, DocumentStructure, Topic
+from ..document_processor import format_structure_for_agent
+from ..cache import make_cache_key, check_cache, save_to_cache
+
+
+# Bump whenever the prompt changes so cached responses are invalidated
+PROMPT_VERSION = 5
+
+# Difficulty levels cycled through across the quiz
+DIFFICULTIES = ("easy", "medium", "hard")
+
+# Static prompt sections, built once at import time
+_PROMPT_HEADER = """You are a Quiz Generation Agent. Your task is to create one multiple-choice question based on the document content."""
+
+_PROMPT_INSTRUCTIONS = """Follow these rules:
+
+1. The question must have exactly 4 choices (A, B, C, D)
+2. Exactly 1 choice is correct, 3 are wrong
+3. Each choice (correct AND incorrect) must have a detailed explanation
+4. Explanations for correct answers should explain WHY it's correct
+5. Explanations for wrong answers should explain WHY it's incorrect and what the misconception is
+6. Reference the page number where the answer can be found
+
+Return a JSON object with this structure:
+{
+  "question_id": "q_1",
+  "question_text": "What is...?",
+  "topic_id": "topic_1",
+  "difficulty": "medium",
+  "page_reference": 5,
+  "choices": [
+    {
+      "choice_id": "q_1_a",
+      "text": "Choice A text",
+      "is_correct": true,
+      "explanation": "This is correct because... The document states on page 5 that..."
+    },
+    {
+      "choice_id": "q_1_b",
+      "text": "Choice B text",
+      "is_correct": false,
+      "explanation": "This is incorrect because... While it might seem like..., the document actually indicates..."
+    },
+    {
+      "choice_id": "q_1_c",
+      "text": "Choice C text",
+      "is_correct": false,
+      "explanation": "This is incorrect because..."
+    },
+    {
+      "choice_id": "q_1_d",
+      "text": "Choice D text",
+      "is_correct": false,
+      "explanation": "This is incorrect because..."
+    }
+  ]
+}
+
+Guidelines:
+- The question should test understanding, not just memorization
+- Wrong answers should be plausible but clearly incorrect
+- Explanations should be educational and reference the document
+- Make explanations detailed enough to aid learning (2-3 sentences minimum)
+"""
+
+
+def _hit_token_cap(response: types.GenerateContentResponse) -> bool:
+    """Whether generation stopped at max_output_tokens, truncating the JSON"""
+    return any(
+        candidate.finish_reason == types.FinishReason.MAX_TOKENS
+        for candidate in response.candidates or []
+    )
 
 
 class QuizAgent:
@@ -15,149 +85,245 @@ class QuizAgent:
     answers and detailed explanations.
     """
     
-    def __init__(self):
-        """Initialize the Quiz Agent with Google ADK"""
-        self.client = genai.Client(api_key=GOOGLE_API_KEY)
+    def __init__(
+        self,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        rate_limiter: Optional[AsyncLimiter] = None
+    ):
+        """
+        Initialize the Quiz Agent with Google ADK
+        
+        Args:
+            semaphore: Shared cap on in-flight model requests
+            rate_limiter: Shared requests-per-minute limiter
+        """
+        self.client = client
         self.model_name = MODEL_NAME
+        self._semaphore = semaphore or nullcontext()
+        self._rate_limiter = rate_limiter or nullcontext()
         
     async def generate_quiz(
         self,
         document: str,
         structure: DocumentStructure,
-        num_questions: int = 10
+        num_questions: int = 10,
+        topics_json: Optional[str] = None
     ) -> Quiz:
         """
         Generate quiz questions based on the document.
         
+        Each question is requested separately and all requests run
+        concurrently, so latency is that of a single question rather
+        than of the whole quiz.
+        
         Args:
             document: Full document text
             structure: Document structure for topic-based questions
             num_questions: Number of questions to generate
+            topics_json: Pre-serialized structure from format_structure_for_agent
             
         Returns:
             Quiz with questions, choices, and explanations
         """
         
-        prompt = self._create_quiz_prompt(document, structure, num_questions)
-        
-        response = await self.client.aio.models.generate_content(
-            model=self.model_name,
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                temperature=0.7,
-                response_mime_type="application/json",
-            )
+        results = await asyncio.gather(
+            *self._question_requests(document, structure, num_questions, topics_json)
         )
         
-        quiz_data = json.loads(response.text)
-        
-        questions = []
-        for q_data in quiz_data.get("questions", []):
-            choices = []
-            for c_data in q_data.get("choices", []):
-                choices.append(QuizChoice(
-                    choice_id=c_data.get("choice_id", str(uuid.uuid4())),
-                    text=c_data["text"],
-                    is_correct=c_data["is_correct"],
-                    explanation=c_data["explanation"]
-                ))
-            
-            questions.append(QuizQuestion(
-                question_id=q_data.get("question_id", str(uuid.uuid4())),
-                question_text=q_data["question_text"],
-                choices=choices,
-                topic_id=q_data.get("topic_id", ""),
-                difficulty=q_data.get("difficulty", "medium"),
-                page_reference=q_data.get("page_reference", 1)
-            ))
+        # Questions that could not be generated are dropped, not fatal
+        questions = [question for question in results if question is not None]
         
         return Quiz(
             questions=questions,
             total_questions=len(questions)
         )
     
-    def _create_quiz_prompt(
+    async def stream_quiz(
+        self,
+        document: str,
+        structure: DocumentStructure,
+        num_questions: int = 10,
+        topics_json: Optional[str] = None
+    ) -> AsyncIterator[QuizQuestion]:
+        """
+        Stream quiz questions as their requests complete. Requests still
+        running when the consumer stops iterating are cancelled.
+        
+        Args:
+            document: Full document text
+            structure: Document structure for topic-based questions
+            num_questions: Number of questions to generate
+            topics_json: Pre-serialized structure from format_structure_for_agent
+            
+        Yields:
+            Each QuizQuestion as soon as it has been generated
+        """
+        
+        tasks = [
+            asyncio.create_task(request)
+            for request in self._question_requests(document, structure, num_questions, topics_json)
+        ]
+        try:
+            for next_question in asyncio.as_completed(tasks):
+                question = await next_question
+                if question is not None:
+                    yield question
+        finally:
+            # Stop billing model calls once the consumer has gone away
+            for task in tasks:
+                task.cancel()
+    
+    def _question_requests(
         self,
         document: str,
         structure: DocumentStructure,
+        num_questions: int,
+        topics_json: Optional[str]
+    ) -> List[Awaitable[Optional[QuizQuestion]]]:
+        """Create one single-question request per quiz question"""
+        
+        if topics_json is None:
+            topics_json = format_structure_for_agent(structure)
+        
+        return [
+            self._generate_one_question(document, topics_json, topic, difficulty, index)
+            for index, (topic, difficulty) in enumerate(
+                self._plan_questions(structure, num_questions), start=1
+            )
+        ]
+    
+    def _plan_questions(
+        self,
+        structure: DocumentStructure,
         num_questions: int
+    ) -> List[Tuple[Optional[Topic], str]]:
+        """
+        Assign a target topic and difficulty to every question.
+        
+        Topics are assigned round-robin so questions are distributed across
+        the document, and difficulties cycle through easy, medium and hard.
+        """
+        
+        topics = structure.topics or [None]
+        return [
+            (topics[i % len(topics)], DIFFICULTIES[i % len(DIFFICULTIES)])
+            for i in range(num_questions)
+        ]
+    
+    async def _generate_one_question(
+        self,
+        document: str,
+        topics_json: str,
+        target_topic: Optional[Topic],
+        difficulty: str,
+        index: int
+    ) -> Optional[QuizQuestion]:
+        """
+        Generate a single quiz question.
+        
+        A response that was cut off at the output token cap or does not
+        parse is requested again, up to QUIZ_QUESTION_ATTEMPTS times in
+        total. If every attempt fails the question is dropped, so one bad
+        response does not fail the whole quiz.
+        
+        Args:
+            document: Full document text
+            topics_json: Pre-serialized structure from format_structure_for_agent
+            target_topic: Topic the question should test, or None for any topic
+            difficulty: One of 'easy', 'medium', 'hard'
+            index: 1-based position of the question in the quiz
+            
+        Returns:
+            The generated QuizQuestion, or None if it could not be generated
+        """
+        
+        prompt = self._create_quiz_prompt(document, topics_json, target_topic, difficulty, index)
+        
+        config = self._create_generation_config()
+        cache_key = make_cache_key(prompt, self.model_name, PROMPT_VERSION, config)
+        text = await check_cache(cache_key)
+        if text is not None:
+            return self._parse_response(text, index)
+        
+        for attempt in range(1, QUIZ_QUESTION_ATTEMPTS + 1):
+            async with self._semaphore, self._rate_limiter:
+                response = await call_model(
+                    self.client,
+                    model=self.model_name,
+                    contents=prompt,
+                    config=config
+                )
+            
+            if _hit_token_cap(response):
+                print(f"⚠️  Quiz question {index} hit the output token cap (attempt {attempt})")
+                continue
+            
+            question = self._try_parse_response(response.text, index)
+            if question is None:
+                print(f"⚠️  Quiz question {index} could not be parsed (attempt {attempt})")
+                continue
+            
+            await save_to_cache(cache_key, response.text)
+            return question
+        
+        print(f"⚠️  Dropping quiz question {index}")
+        return None
+    
+    def _create_generation_config(self) -> types.GenerateContentConfig:
+        """Create the generation config used for quiz requests"""
+        
+        return types.GenerateContentConfig(
+            temperature=0.7,
+            max_output_tokens=THINKING_BUDGET + QUIZ_MAX_OUTPUT_TOKENS,
+            thinking_config=types.ThinkingConfig(thinking_budget=THINKING_BUDGET),
+            response_mime_type="application/json",
+            response_schema=QuizQuestionSchema,
+        )
+    
+    def _parse_response(self, text: str, index: int) -> QuizQuestion:
+        """Parse the raw JSON model response into a QuizQuestion"""
+        
+        # Decode and validate in one pass inside pydantic-core
+        question = QuizQuestion.model_validate_json(text)
+        
+        # Questions are generated independently, so enforce unique IDs here
+        question.question_id = f"q_{index}"
+        for letter, choice in zip("abcd", question.choices):
+            choice.choice_id = f"q_{index}_{letter}"
+        
+        return question
+    
+    def _try_parse_response(self, text: Optional[str], index: int) -> Optional[QuizQuestion]:
+        """Parse a QuizQuestion, returning None for missing or malformed JSON"""
+        
+        if not text:
+            return None
+        try:
+            return self._parse_response(text, index)
+        except ValueError:
+            # pydantic's ValidationError, raised for bad JSON and bad fields
+            return None
+    
+    def _create_quiz_prompt(
+        self,
+        document: str,
+        topics_json: str,
+        target_topic: Optional[Topic],
+        difficulty: str,
+        index: int
     ) -> str:
-        """Create the prompt for quiz generation"""
-        
-        structure_json = json.dumps({
-            "topics": [
-                {
-                    "id": topic.id,
-                    "title": topic.title,
-                    "page_range": topic.page_range
-                }
-                for topic in structure.topics
-            ]
-        }, indent=2)
-        
-        return f"""You are a Quiz Generation Agent. Your task is to create comprehensive multiple-choice questions based on the document content.
-
-DOCUMENT:
-{document}
-
-DOCUMENT STRUCTURE:
-{structure_json}
-
-INSTRUCTIONS:
-Generate {num_questions} multiple-choice quiz questions following these rules:
-
-1. Each question must have exactly 4 choices (A, B, C, D)
-2. Exactly 1 choice is correct, 3 are wrong
-3. Each choice (correct AND incorrect) must have a detailed explanation
-4. Explanations for correct answers should explain WHY it's correct
-5. Explanations for wrong answers should explain WHY it's incorrect and what the misconception is
-6. Distribute questions across different topics
-7. Vary difficulty levels (easy, medium, hard)
-8. Reference the page number where the answer can be found
-
-Return a JSON object with this structure:
-{{
-  "questions": [
-    {{
-      "question_id": "q_1",
-      "question_text": "What is...?",
-      "topic_id": "topic_1",
-      "difficulty": "medium",
-      "page_reference": 5,
-      "choices": [
-        {{
-          "choice_id": "q_1_a",
-          "text": "Choice A text",
-          "is_correct": true,
-          "explanation": "This is correct because... The document states on page 5 that..."
-        }},
-        {{
-          "choice_id": "q_1_b",
-          "text": "Choice B text",
-          "is_correct": false,
-          "explanation": "This is incorrect because... While it might seem like..., the document actually indicates..."
-        }},
-        {{
-          "choice_id": "q_1_c",
-          "text": "Choice C text",
-          "is_correct": false,
-          "explanation": "This is incorrect because..."
-        }},
-        {{
-          "choice_id": "q_1_d",
-          "text": "Choice D text",
-          "is_correct": false,
-          "explanation": "This is incorrect because..."
-        }}
-      ]
-    }}
-  ]
-}}
-
-Guidelines:
-- Questions should test understanding, not just memorization
-- Wrong answers should be plausible but clearly incorrect
-- Explanations should be educational and reference the document
-- Ensure questions cover all major topics proportionally
-- Make explanations detailed enough to aid learning (2-3 sentences minimum)
-"""
+        """Create the prompt for a single quiz question"""
+        
+        if target_topic is not None:
+            focus = f'The question must test the topic "{target_topic.title}" (topic_id "{target_topic.id}").'
+        else:
+            focus = "The question may test any part of the document."
+        
+        return (
+            f"{_PROMPT_HEADER}\n\n"
+            f"DOCUMENT:\n{document}\n\n"
+            f"DOCUMENT STRUCTURE:\n{topics_json}\n\n"
+            f"INSTRUCTIONS:\n"
+            f"Generate quiz question {index}, a multiple-choice question of {difficulty} difficulty. {focus}\n\n"
+            f"{_PROMPT_INSTRUCTIONS}"
+        )
@@ -1,82 +1,21 @@
-from google import genai
+from typing import Optional
 from google.genai import types
-import sys
-import os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import GOOGLE_API_KEY, MODEL_NAME
-from models import DocumentStructure, Topic, SubTopic
-import json
-import uuid
+import asyncio
+from contextlib import nullcontext
+from aiolimiter import AsyncLimiter
+from ..config import MODEL_NAME, STRUCTURE_MAX_OUTPUT_TOKENS
+from ..client import client, call_model
+from ..models import DocumentStructure, DocumentStructureSchema
+from ..cache import make_cache_key, check_cache, save_to_cache
 
 
-class StructurizationAgent:
-    """
-    Agent responsible for analyzing document topics and creating
-    a hierarchical directory-like structure.
-    """
-    
-    def __init__(self):
-        """Initialize the Structurization Agent with Google ADK"""
-        self.client = genai.Client(api_key=GOOGLE_API_KEY)
-        self.model_name = MODEL_NAME
-        
-    async def analyze_structure(self, document: str) -> DocumentStructure:
-        """
-        Analyze the document and create a hierarchical topic structure.
-        
-        Args:
-            document: Full document text with page markers
-            
-        Returns:
-            DocumentStructure with topics and subtopics
-        """
-        
-        prompt = self._create_structure_prompt(document)
-        
-        response = await self.client.aio.models.generate_content(
-            model=self.model_name,
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                temperature=0.4,
-                response_mime_type="application/json",
-            )
-        )
-        
-        structure_data = json.loads(response.text)
-        
-        topics = []
-        for topic_data in structure_data.get("topics", []):
-            subtopics = []
-            for st_data in topic_data.get("subtopics", []):
-                subtopics.append(SubTopic(
-                    id=st_data.get("id", str(uuid.uuid4())),
-                    title=st_data["title"],
-                    page_reference=st_data["page_reference"],
-                    char_start=st_data.get("char_start"),
-                    char_end=st_data.get("char_end")
-                ))
-            
-            topics.append(Topic(
-                id=topic_data.get("id", str(uuid.uuid4())),
-                title=topic_data["title"],
-                subtopics=subtopics,
-                page_range=topic_data["page_range"]
-            ))
-        
-        return DocumentStructure(
-            topics=topics,
-            document_title=structure_data.get("document_title", "Untitled Document")
-        )
-    
-    def _create_structure_prompt(self, document: str) -> str:
-        """Create the prompt for structure analysis"""
-        
-        return f"""You are a Document Structurization Agent. Your task is to analyze a document and create a hierarchical topic structure that represents its organization.
+# Bump whenever the prompt changes so cached responses are invalidated
+PROMPT_VERSION = 2
 
-DOCUMENT:
-{document}
+# Static prompt sections, built once at import time
+_PROMPT_HEADER = """You are a Document Structurization Agent. Your task is to analyze a document and create a hierarchical topic structure that represents its organization."""
 
-INSTRUCTIONS:
+_PROMPT_INSTRUCTIONS = """INSTRUCTIONS:
 1. Identify all major topics in the document
 2. For each major topic, identify 2-5 subtopics
 3. Note which pages each topic spans
@@ -85,25 +24,25 @@ INSTRUCTIONS:
 6. Determine the overall document title
 
 Return a JSON object with this structure:
-{{
+{
   "document_title": "Title of the document",
   "topics": [
-    {{
+    {
       "id": "topic_1",
       "title": "Main Topic Title",
       "page_range": [1, 5],
       "subtopics": [
-        {{
+        {
           "id": "topic_1_sub_1",
           "title": "Subtopic Title",
           "page_reference": 1,
           "char_start": 0,
           "char_end": 500
-        }}
+        }
       ]
-    }}
+    }
   ]
-}}
+}
 
 Guidelines:
 - Main topics should be broad, overarching concepts
@@ -112,3 +51,84 @@ Guidelines:
 - Page references should be accurate based on [PAGE X] markers
 - Each topic should have at least 1 subtopic
 """
+
+
+class StructurizationAgent:
+    """
+    Agent responsible for analyzing document topics and creating
+    a hierarchical directory-like structure.
+    """
+    
+    def __init__(
+        self,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        rate_limiter: Optional[AsyncLimiter] = None
+    ):
+        """
+        Initialize the Structurization Agent with Google ADK
+        
+        Args:
+            semaphore: Shared cap on in-flight model requests
+            rate_limiter: Shared requests-per-minute limiter
+        """
+        self.client = client
+        self.model_name = MODEL_NAME
+        self._semaphore = semaphore or nullcontext()
+        self._rate_limiter = rate_limiter or nullcontext()
+        
+    async def analyze_structure(self, document: str) -> DocumentStructure:
+        """
+        Analyze the document and create a hierarchical topic structure.
+        
+        Args:
+            document: Full document text with page markers
+            
+        Returns:
+            DocumentStructure with topics and subtopics
+        """
+        
+        prompt = self._create_structure_prompt(document)
+        
+        config = self._create_generation_config()
+        cache_key = make_cache_key(prompt, self.model_name, PROMPT_VERSION, config)
+        text = await check_cache(cache_key)
+        if text is not None:
+            return self._parse_response(text)
+        
+        async with self._semaphore, self._rate_limiter:
+            response = await call_model(
+                self.client,
+                model=self.model_name,
+                contents=prompt,
+                config=config
+            )
+        
+        # The SDK decodes schema-constrained output into the model for us
+        result = response.parsed
+        if result is None:
+            result = self._parse_response(response.text)
+        await save_to_cache(cache_key, response.text)
+        return result
+    
+    def _create_generation_config(self) -> types.GenerateContentConfig:
+        """Create the generation config used for structure requests"""
+        
+        return types.GenerateContentConfig(
+            # Extraction task: deterministic output, no thinking needed
+            temperature=0.0,
+            max_output_tokens=STRUCTURE_MAX_OUTPUT_TOKENS,
+            thinking_config=types.ThinkingConfig(thinking_budget=0),
+            response_mime_type="application/json",
+            response_schema=DocumentStructureSchema,
+        )
+    
+    def _parse_response(self, text: str) -> DocumentStructure:
+        """Parse the raw JSON model response into a DocumentStructure"""
+        
+        # Decode and validate in one pass inside pydantic-core
+        return DocumentStructure.model_validate_json(text)
+    
+    def _create_structure_prompt(self, document: str) -> str:
+        """Create the prompt for structure analysis"""
+        
+        return f"{_PROMPT_HEADER}\n\nDOCUMENT:\n{document}\n\n{_PROMPT_INSTRUCTIONS}"
@@ -0,0 +1,203 @@
+"""
+Batch processing for offline document ingestion.
+
+Instead of issuing one realtime Gemini request per agent per document,
+the prompts of many documents are submitted together as Gemini batch jobs.
+Batch jobs are cheaper but can take minutes to complete, so this path is
+meant for bulk/nightly ingestion rather than interactive requests.
+"""
+
+import asyncio
+from typing import Dict, Any, List, Tuple
+from google.genai import types
+from .config import MODEL_NAME
+from .client import client
+from .orchestrator import AgentOrchestrator
+from .document_processor import format_pages, format_structure_for_agent, group_pages
+from .models import HighlightedDocument, Quiz
+
+
+# Seconds to wait between batch job status checks
+BATCH_POLL_INTERVAL = 30
+
+_FINISHED_STATES = {
+    "JOB_STATE_SUCCEEDED",
+    "JOB_STATE_FAILED",
+    "JOB_STATE_CANCELLED",
+    "JOB_STATE_EXPIRED"
+}
+
+
+class BatchAgentRunner:
+    """
+    Runs the agent pipeline for many documents at once using Gemini batch
+    jobs. Each pipeline stage (structure, highlights + quiz, explanations)
+    is submitted as a single job covering every document.
+    """
+
+    def __init__(
+        self,
+        orchestrator: AgentOrchestrator = None,
+        poll_interval: int = BATCH_POLL_INTERVAL
+    ):
+        """Initialize the runner, reusing the orchestrator's agents"""
+        self._owns_orchestrator = orchestrator is None
+        self.orchestrator = orchestrator or AgentOrchestrator()
+        self.client = client
+        self.model_name = MODEL_NAME
+        self.poll_interval = poll_interval
+
+    def close(self):
+        """Shut down the orchestrator's process pool if this runner created it"""
+        if self._owns_orchestrator:
+            self.orchestrator.shutdown()
+
+    def __enter__(self) -> "BatchAgentRunner":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    async def run(self, requests: List[Tuple[types.GenerateContentConfig, str]]) -> List[str]:
+        """
+        Submit prompts as a single batch job and wait for it to finish.
+
+        Args:
+            requests: List of (config, prompt) tuples, where config comes from
+                the owning agent's _create_generation_config
+
+        Returns:
+            Raw response texts, in the same order as the requests
+        """
+
+        inlined_requests = [
+            types.InlinedRequest(contents=prompt, config=config)
+            for config, prompt in requests
+        ]
+
+        job = await self.client.aio.batches.create(
+            model=self.model_name,
+            src=inlined_requests
+        )
+
+        while job.state.name not in _FINISHED_STATES:
+            await asyncio.sleep(self.poll_interval)
+            job = await self.client.aio.batches.get(name=job.name)
+
+        if job.state.name != "JOB_STATE_SUCCEEDED":
+            raise Exception(f"Batch job {job.name} finished with state {job.state.name}")
+
+        texts = []
+        for inlined_response in job.dest.inlined_responses:
+            if inlined_response.error:
+                raise Exception(f"Batch request failed: {inlined_response.error}")
+            texts.append(inlined_response.response.text)
+
+        return texts
+
+    async def process_documents(
+        self,
+        pdf_paths: List[str],
+        num_quiz_questions: int = 10,
+        latency_sensitive: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Process many PDF documents through all agents using batch jobs.
+
+        Args:
+            pdf_paths: Paths to the PDF files
+            num_quiz_questions: Number of quiz questions per document
+            latency_sensitive: Use the realtime path for a single document
+
+        Returns:
+            One result dictionary per document, as from process_document
+        """
+
+        if len(pdf_paths) == 1 and latency_sensitive:
+            return [await self.orchestrator.process_document(pdf_paths[0], num_quiz_questions)]
+
+        doc_processor = self.orchestrator.doc_processor
+        structurization_agent = self.orchestrator.structurization_agent
+        highlighter_agent = self.orchestrator.highlighter_agent
+        explanation_agent = self.orchestrator.explanation_agent
+        quiz_agent = self.orchestrator.quiz_agent
+
+        print(f"📄 Extracting text from {len(pdf_paths)} PDFs...")
+        all_pages = await asyncio.gather(*[
+            self.orchestrator._extract_pages(path) for path in pdf_paths
+        ])
+        documents = [doc_processor.format_document_for_agent(pages) for pages in all_pages]
+
+        # Stage 1: Structure for every document
+        print("🗂️  Submitting structure batch...")
+        config = structurization_agent._create_generation_config()
+        texts = await self.run([
+            (config, structurization_agent._create_structure_prompt(document))
+            for document in documents
+        ])
+        structures = [structurization_agent._parse_response(text) for text in texts]
+        all_topics_json = [format_structure_for_agent(structure) for structure in structures]
+
+        # Stage 2: Highlights and quizzes only need the structure. Each page
+        # group and each quiz question is its own request, mirroring the
+        # realtime path.
+        print("✨ Submitting highlight and quiz batch...")
+        quiz_config = quiz_agent._create_generation_config()
+        requests = []
+        for pages, document, structure, topics_json in zip(
+            all_pages, documents, structures, all_topics_json
+        ):
+            for page_group in group_pages(pages):
+                requests.append((
+                    highlighter_agent._create_generation_config(len(page_group)),
+                    highlighter_agent._create_highlight_prompt(format_pages(page_group), topics_json)
+                ))
+            for index, (topic, difficulty) in enumerate(
+                quiz_agent._plan_questions(structure, num_quiz_questions), start=1
+            ):
+                requests.append((
+                    quiz_config,
+                    quiz_agent._create_quiz_prompt(document, topics_json, topic, difficulty, index)
+                ))
+        texts = iter(await self.run(requests))
+
+        all_highlights = []
+        quizzes = []
+        for pages in all_pages:
+            highlights = [
+                h for _ in group_pages(pages)
+                for h in highlighter_agent._parse_response(next(texts), len(pages)).highlights
+            ]
+            all_highlights.append(HighlightedDocument(highlights=highlights, total_pages=len(pages)))
+            # Drop truncated or malformed questions, as the realtime path does
+            questions = [
+                question for question in (
+                    quiz_agent._try_parse_response(next(texts), index)
+                    for index in range(1, num_quiz_questions + 1)
+                )
+                if question is not None
+            ]
+            quizzes.append(Quiz(questions=questions, total_questions=len(questions)))
+
+        # Stage 3: Explanations need structure and highlights
+        print("📚 Submitting explanation batch...")
+        requests = []
+        for document, pages, structure, topics_json, highlights in zip(
+            documents, all_pages, structures, all_topics_json, all_highlights
+        ):
+            excerpt = explanation_agent._create_excerpt(document, structure, pages)
+            requests.append((
+                explanation_agent._create_generation_config(len(structure.topics)),
+                explanation_agent._create_explanation_prompt(excerpt, topics_json, highlights)
+            ))
+        texts = await self.run(requests)
+        all_explanations = [explanation_agent._parse_response(text) for text in texts]
+
+        print("✅ Batch processing complete!")
+
+        return [
+            self.orchestrator._assemble_results(pages, structure, highlights, explanations, quiz)
+            for pages, structure, highlights, explanations, quiz in zip(
+                all_pages, structures, all_highlights, all_explanations, quizzes
+            )
+        ]
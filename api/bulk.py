@@ -0,0 +1,53 @@
+"""
+Bulk processing of many PDF documents through the realtime agent path.
+
+All documents are processed concurrently, but every agent shares one
+semaphore and one rate limiter so the combined request load stays under
+the Gemini quota tier instead of triggering 429s and backoff retries.
+"""
+
+import asyncio
+from typing import Any, Dict, List, Union
+from .config import MAX_CONCURRENT_REQUESTS, REQUESTS_PER_MINUTE
+from .orchestrator import AgentOrchestrator
+
+
+async def process_documents(
+    pdf_paths: List[str],
+    num_quiz_questions: int = 10,
+    qpm: int = REQUESTS_PER_MINUTE,
+    concurrency: int = MAX_CONCURRENT_REQUESTS
+) -> List[Union[Dict[str, Any], Exception]]:
+    """
+    Process many PDF documents concurrently within request limits.
+    
+    Text extraction is CPU-bound, so it runs in a process pool where
+    documents can be extracted in parallel without contending for the GIL.
+    
+    Args:
+        pdf_paths: Paths to the PDF files
+        num_quiz_questions: Number of quiz questions per document
+        qpm: Maximum model requests per minute across all documents
+        concurrency: Maximum in-flight model requests across all documents
+        
+    Returns:
+        One entry per document, in order: the process_document result, or
+        the exception raised while processing that document
+    """
+    
+    # The orchestrator extracts text in its own process pool
+    orchestrator = AgentOrchestrator(
+        max_concurrent_requests=concurrency,
+        requests_per_minute=qpm
+    )
+    
+    try:
+        return await asyncio.gather(
+            *[
+                orchestrator.process_document(pdf_path, num_quiz_questions)
+                for pdf_path in pdf_paths
+            ],
+            return_exceptions=True
+        )
+    finally:
+        orchestrator.shutdown()
@@ -0,0 +1,125 @@
+"""
+Response cache for agent model calls.
+
+Raw model responses are stored in SQLite keyed by a hash of the prompt,
+the model name, the agent's prompt version and the generation config, so
+re-processing the same document skips the Gemini round trip entirely.
+
+Database access runs in a worker thread so it never blocks the event loop,
+and cache errors (e.g. "database is locked" with several server workers
+sharing the file) are logged and treated as a miss rather than failing
+the request.
+"""
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Optional
+import orjson
+from google.genai import types
+from pydantic import BaseModel
+from .config import CACHE_PATH, CACHE_TTL
+
+
+_connection: Optional[sqlite3.Connection] = None
+
+# The connection is shared by all worker threads; one statement at a time
+_lock = threading.Lock()
+
+
+def _get_connection() -> sqlite3.Connection:
+    """Open the cache database on first use; call with _lock held"""
+    global _connection
+    if _connection is None:
+        _connection = sqlite3.connect(CACHE_PATH, check_same_thread=False)
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+    return _connection
+
+
+def _config_fingerprint(config: types.GenerateContentConfig) -> bytes:
+    """Serialize a generation config, including its response schema, stably"""
+    schema = config.response_schema
+    if isinstance(schema, type) and issubclass(schema, BaseModel):
+        schema = schema.model_json_schema()
+    return orjson.dumps(
+        [
+            config.model_dump(mode="json", exclude_none=True, exclude={"response_schema"}),
+            schema
+        ],
+        option=orjson.OPT_SORT_KEYS
+    )
+
+
+def make_cache_key(
+    prompt: str,
+    model_name: str,
+    prompt_version: int,
+    config: types.GenerateContentConfig
+) -> str:
+    """Build the cache key for a prompt sent to a given model with a given config"""
+    parts = [
+        prompt.encode("utf-8"),
+        model_name.encode("utf-8"),
+        str(prompt_version).encode("utf-8"),
+        _config_fingerprint(config)
+    ]
+    
+    # Length-prefix every part; PDF text may contain any delimiter byte
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def _check_cache(key: str) -> Optional[str]:
+    """Blocking lookup for check_cache"""
+    with _lock:
+        connection = _get_connection()
+        row = connection.execute(
+            "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        
+        if row is None:
+            return None
+        
+        value, expires_at = row
+        if expires_at < time.time():
+            with connection:
+                connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        
+        return value
+
+
+def _save_to_cache(key: str, value: str, ttl: int) -> None:
+    """Blocking write for save_to_cache"""
+    with _lock:
+        connection = _get_connection()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl)
+            )
+
+
+async def check_cache(key: str) -> Optional[str]:
+    """Return the cached response text for a key, or None on a miss or error"""
+    try:
+        return await asyncio.to_thread(_check_cache, key)
+    except sqlite3.Error as e:
+        print(f"⚠️  Response cache read failed ({e}), calling the model")
+        return None
+
+
+async def save_to_cache(key: str, value: str, ttl: int = CACHE_TTL) -> None:
+    """Store a response text under a key for ttl seconds; errors are only logged"""
+    try:
+        await asyncio.to_thread(_save_to_cache, key, value, ttl)
+    except sqlite3.Error as e:
+        print(f"⚠️  Response cache write failed ({e})")
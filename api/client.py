@@ -0,0 +1,92 @@
+"""
+Shared Gemini client for all agents.
+
+A single client keeps one HTTP connection pool, so TLS/TCP connections
+stay warm and are reused across agents instead of every agent opening
+its own pool.
+"""
+
+import httpx
+from collections import Counter
+from google import genai
+from google.genai import errors, types
+from tenacity import (
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_random_exponential
+)
+from .config import GOOGLE_API_KEY
+
+
+client = genai.Client(
+    api_key=GOOGLE_API_KEY,
+    http_options=types.HttpOptions(
+        async_client_args={
+            "limits": httpx.Limits(max_connections=64, max_keepalive_connections=32)
+        }
+    )
+)
+
+# HTTP status codes worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Number of retries per error type, for tuning MAX_CONCURRENT_REQUESTS
+retry_counts = Counter()
+
+
+def _is_transient(error: BaseException) -> bool:
+    """Whether a failed model request is worth retrying"""
+    if isinstance(error, errors.APIError):
+        return error.code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (TimeoutError, httpx.TimeoutException))
+
+
+def _record_retry(retry_state) -> None:
+    """Count and report a retry before backing off"""
+    error = retry_state.outcome.exception()
+    retry_counts[type(error).__name__] += 1
+    print(f"⚠️  Model request failed ({error}), retry {retry_state.attempt_number}...")
+
+
+_retry_transient = retry(
+    retry=retry_if_exception(_is_transient),
+    wait=wait_random_exponential(multiplier=1, max=32),
+    stop=stop_after_attempt(6),
+    before_sleep=_record_retry,
+    reraise=True
+)
+
+
+@_retry_transient
+async def call_model(client: genai.Client, **kwargs) -> types.GenerateContentResponse:
+    """
+    Call generate_content, retrying transient failures with jittered
+    exponential backoff.
+    
+    Args:
+        client: Gemini client
+        **kwargs: Arguments for generate_content (model, contents, config)
+        
+    Returns:
+        The model response
+    """
+    return await client.aio.models.generate_content(**kwargs)
+
+
+@_retry_transient
+async def open_model_stream(client: genai.Client, **kwargs):
+    """
+    Start generate_content_stream, retrying transient failures.
+    
+    Only opening the stream is retried; errors after chunks have been
+    received are raised to the caller.
+    
+    Args:
+        client: Gemini client
+        **kwargs: Arguments for generate_content_stream (model, contents, config)
+        
+    Returns:
+        Async iterator over response chunks
+    """
+    return await client.aio.models.generate_content_stream(**kwargs)
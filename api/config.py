@@ -25,3 +25,53 @@ MODEL_NAME = "gemini-2.5-flash"
 CHUNK_SIZE = 2000
 OVERLAP_SIZE = 200
 MAX_PAGES_PER_REQUEST = 50
+EXTRACTION_PAGES_PER_TASK = 25  # pages extracted per process pool task
+MAX_UPLOAD_BYTES = 100 * 1024 * 1024  # larger uploads are rejected
+
+# Response cache settings
+CACHE_PATH = os.getenv(
+    "AGENT_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "agent_cache.db")
+)
+CACHE_TTL = 7 * 86400  # seconds
+
+# In-memory cache of endpoint responses for re-uploaded PDFs
+RESULTS_CACHE_SIZE = 128
+RESULTS_CACHE_TTL = 3600  # seconds
+
+# Model request limits, shared by all agents. The server splits them
+# evenly between its workers.
+MAX_CONCURRENT_REQUESTS = int(os.getenv("GEMINI_MAX_CONCURRENT_REQUESTS", "32"))
+REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "500"))
+
+# Documents processed at once by each server worker; further uploads wait
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "4"))
+
+# Largest quiz a single request may ask for; every question is its own
+# model request
+MAX_QUIZ_QUESTIONS = 50
+
+# Server processes, and extraction processes per server worker. The CPUs are
+# split between workers so the total stays at about one process per CPU.
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", str(os.cpu_count() or 1)))
+EXTRACTION_WORKERS = int(os.getenv(
+    "EXTRACTION_WORKERS",
+    str(max(1, (os.cpu_count() or 1) // SERVER_WORKERS))
+))
+
+# Prompt size budgets (Gemini averages roughly 4 characters per token)
+CHARS_PER_TOKEN = 4
+EXPLANATION_CONTEXT_TOKENS = 1000
+
+# Output token caps per request. Gemini 2.5 counts thinking tokens against
+# max_output_tokens, so agents that think get an explicit thinking budget
+# on top of the room needed for their JSON answer.
+STRUCTURE_MAX_OUTPUT_TOKENS = 2048
+HIGHLIGHT_MAX_OUTPUT_TOKENS = 1024  # per page
+HIGHLIGHT_PAGES_PER_REQUEST = 4
+HIGHLIGHT_MAX_REQUEST_TOKENS = 4096  # ceiling for a single highlight request
+QUIZ_MAX_OUTPUT_TOKENS = 1000  # per question
+QUIZ_QUESTION_ATTEMPTS = 2  # a truncated or unparseable question is retried, then dropped
+EXPLANATION_TOKENS_PER_TOPIC = 300
+EXPLANATION_BASE_TOKENS = 500
+THINKING_BUDGET = 1024
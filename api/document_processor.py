@@ -1,6 +1,9 @@
-from typing import List, Dict
-import PyPDF2
+from typing import List, Dict, Optional
+import pypdfium2 as pdfium
+import orjson
 from dataclasses import dataclass
+from .models import DocumentStructure
+from .config import CHARS_PER_TOKEN, HIGHLIGHT_PAGES_PER_REQUEST
 
 
 @dataclass
@@ -27,21 +30,57 @@ class DocumentProcessor:
         Returns:
             List of PageContent objects with text from each page
         """
+        return self.extract_page_range(pdf_path, 0, None)
+    
+    def count_pages(self, pdf_path: str) -> int:
+        """Return the number of pages in a PDF file"""
+        try:
+            pdf = pdfium.PdfDocument(pdf_path)
+            try:
+                return len(pdf)
+            finally:
+                pdf.close()
+        except Exception as e:
+            raise Exception(f"Error reading PDF: {str(e)}")
+    
+    def extract_page_range(
+        self,
+        pdf_path: str,
+        start: int,
+        stop: Optional[int]
+    ) -> List[PageContent]:
+        """
+        Extract text from a range of pages of a PDF file.
+        
+        Args:
+            pdf_path: Path to the PDF file
+            start: 0-based index of the first page
+            stop: 0-based index after the last page, or None for the end
+            
+        Returns:
+            List of PageContent objects with text from each page in the range
+        """
         pages_data = []
         
         try:
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                
-                for page_num, page in enumerate(pdf_reader.pages):
-                    text = page.extract_text()
+            pdf = pdfium.PdfDocument(pdf_path)
+            try:
+                for page_num in range(start, len(pdf) if stop is None else stop):
+                    page = pdf[page_num]
+                    textpage = page.get_textpage()
+                    # PDFium separates lines with CRLF; keep offsets consistent with "\n"
+                    text = textpage.get_text_range().replace("\r\n", "\n").strip()
+                    textpage.close()
+                    page.close()
                     
-                    if text.strip():
+                    if text:
                         pages_data.append(PageContent(
                             page_number=page_num + 1,
-                            text=text.strip(),
-                            char_count=len(text.strip())
+                            text=text,
+                            char_count=len(text)
                         ))
+            finally:
+                pdf.close()
         except Exception as e:
             raise Exception(f"Error reading PDF: {str(e)}")
         
@@ -57,11 +96,7 @@ class DocumentProcessor:
         Returns:
             Formatted document string with page markers
         """
-        formatted = []
-        for page in pages:
-            formatted.append(f"[PAGE {page.page_number}]\n{page.text}\n")
-        
-        return "\n".join(formatted)
+        return format_pages(pages)
     
     def get_page_text(self, pages: List[PageContent], page_number: int) -> str:
         """Get text from a specific page number"""
@@ -69,3 +104,90 @@ class DocumentProcessor:
             if page.page_number == page_number:
                 return page.text
         return ""
+
+
+def format_pages(pages: List[PageContent]) -> str:
+    """Join pages into one string, each preceded by its [PAGE n] marker"""
+    return "\n".join(f"[PAGE {page.page_number}]\n{page.text}\n" for page in pages)
+
+
+def group_pages(
+    pages: List[PageContent],
+    group_size: int = HIGHLIGHT_PAGES_PER_REQUEST
+) -> List[List[PageContent]]:
+    """Split pages into consecutive groups that share one model request"""
+    return [pages[i:i + group_size] for i in range(0, len(pages), group_size)]
+
+
+def format_structure_for_agent(structure: DocumentStructure) -> str:
+    """
+    Serialize the document structure for embedding in agent prompts.
+    
+    The highlighter, explanation and quiz prompts all share this JSON, so
+    callers running several agents should compute it once per document.
+    
+    Args:
+        structure: Document structure from StructurizationAgent
+        
+    Returns:
+        JSON string with the title, topics, page ranges and subtopics
+    """
+    return orjson.dumps({
+        "document_title": structure.document_title,
+        "topics": [
+            {
+                "id": topic.id,
+                "title": topic.title,
+                "page_range": topic.page_range,
+                "subtopics": [{"id": st.id, "title": st.title} for st in topic.subtopics]
+            }
+            for topic in structure.topics
+        ]
+    }, option=orjson.OPT_INDENT_2).decode()
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to an approximate token budget, ending on a word boundary"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    
+    cut = max(text.rfind(" ", 0, max_chars), text.rfind("\n", 0, max_chars))
+    return text[:cut if cut > 0 else max_chars]
+
+
+def excerpt_for_topics(
+    pages: List[PageContent],
+    structure: DocumentStructure,
+    max_tokens: int
+) -> str:
+    """
+    Build a short excerpt from the introduction and the opening page of
+    each topic, fitted to an approximate token budget.
+    
+    Args:
+        pages: List of PageContent objects
+        structure: Document structure from StructurizationAgent
+        max_tokens: Approximate token budget for the whole excerpt
+        
+    Returns:
+        Formatted excerpt with page markers
+    """
+    page_numbers = [pages[0].page_number] if pages else []
+    page_numbers += [min(topic.page_range) for topic in structure.topics if topic.page_range]
+    
+    pages_by_number = {page.page_number: page for page in pages}
+    selected = [
+        pages_by_number[number]
+        for number in dict.fromkeys(page_numbers)
+        if number in pages_by_number
+    ]
+    if not selected:
+        return ""
+    
+    # Split the budget evenly so every topic gets some context
+    tokens_per_page = max(1, max_tokens // len(selected))
+    return "\n".join(
+        f"[PAGE {page.page_number}]\n{truncate_to_tokens(page.text, tokens_per_page)}\n"
+        for page in selected
+    )
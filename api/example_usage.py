@@ -3,11 +3,14 @@ Example usage of the Agent Backend system.
 
 This script demonstrates how to use the agent orchestrator to process
 PDF documents and generate all features.
+
+Run from the repository root:
+    python -m api.example_usage
 """
 
 import asyncio
-import json
-from orchestrator import AgentOrchestrator
+import orjson
+from api.orchestrator import AgentOrchestrator
 
 
 async def process_full_document():
@@ -26,8 +29,8 @@ async def process_full_document():
         )
         
         # Save results to file
-        with open("output_results.json", "w", encoding="utf-8") as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
+        with open("output_results.json", "wb") as f:
+            f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
         
         print("\n📊 Results Summary:")
         print(f"  - Total Pages: {results['metadata']['total_pages']}")
@@ -5,16 +5,50 @@ This provides REST API endpoints for the Next.js frontend to interact
 with the agent system.
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, Query, Request, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Any, AsyncIterator, Optional, Tuple
+from pathlib import Path
+from cachetools import TTLCache
 import tempfile
-import os
-from orchestrator import AgentOrchestrator
+import hashlib
+import orjson
+from .orchestrator import AgentOrchestrator
+from .config import (
+    EXTRACTION_WORKERS,
+    MAX_CONCURRENT_JOBS,
+    MAX_CONCURRENT_REQUESTS,
+    MAX_QUIZ_QUESTIONS,
+    MAX_UPLOAD_BYTES,
+    REQUESTS_PER_MINUTE,
+    RESULTS_CACHE_SIZE,
+    RESULTS_CACHE_TTL,
+    SERVER_WORKERS
+)
 import asyncio
+from contextlib import asynccontextmanager
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Create the orchestrator when the server starts. With several workers,
+    each worker process builds its own copy after it has been spawned.
+    """
+    # Each server worker gets its share of the CPUs for PDF extraction and
+    # of the model request limits
+    app.state.orchestrator = AgentOrchestrator(
+        max_concurrent_requests=max(1, MAX_CONCURRENT_REQUESTS // SERVER_WORKERS),
+        requests_per_minute=max(1, REQUESTS_PER_MINUTE // SERVER_WORKERS),
+        extraction_workers=EXTRACTION_WORKERS
+    )
+    yield
+    app.state.orchestrator.shutdown()
+
 
-app = FastAPI(title="Sensei Agent Backend", version="1.0.0")
+app = FastAPI(title="Sensei Agent Backend", version="1.0.0", lifespan=lifespan)
 
 # Enable CORS for Next.js frontend
 app.add_middleware(
@@ -25,13 +59,166 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize orchestrator
-orchestrator = AgentOrchestrator()
-
 
 class ProcessRequest(BaseModel):
     """Request model for processing options"""
-    num_quiz_questions: int = 10
+    num_quiz_questions: int = Field(default=10, ge=1, le=MAX_QUIZ_QUESTIONS)
+
+
+# Uploads are copied to disk in chunks of this many bytes
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+
+async def _save_upload(file: UploadFile) -> Tuple[str, str]:
+    """
+    Stream an upload to a temporary file without holding it in memory.
+    
+    Args:
+        file: Uploaded PDF
+        
+    Returns:
+        Path of the temporary file and the SHA-256 hex digest of its bytes
+    """
+    
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
+        tmp_path = tmp_file.name
+        try:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                digest.update(chunk)
+                # Write off the event loop so other requests keep running
+                await asyncio.to_thread(tmp_file.write, chunk)
+        except BaseException:
+            # The caller never sees the path, so clean up here (client
+            # abort, disk full, cancellation)
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+    
+    return tmp_path, digest.hexdigest()
+
+
+# Every PDF file starts with this header
+PDF_MAGIC = b"%PDF-"
+
+
+async def _require_pdf(file: UploadFile) -> None:
+    """
+    Reject uploads that are not PDF files or are too large, before anything
+    is written to disk.
+    
+    Args:
+        file: Uploaded PDF; its read position is left at the start
+    """
+    
+    if not file.filename.endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="File must be a PDF")
+    
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="File is too large")
+    
+    head = await file.read(len(PDF_MAGIC))
+    await file.seek(0)
+    if head != PDF_MAGIC:
+        raise HTTPException(status_code=400, detail="File is not a valid PDF")
+
+
+@asynccontextmanager
+async def saved_pdf(file: UploadFile) -> AsyncIterator[Tuple[str, str]]:
+    """
+    Validate an uploaded PDF and save it to a temporary file that is removed
+    when the block exits.
+    
+    Args:
+        file: Uploaded PDF
+        
+    Yields:
+        Path of the temporary file and the SHA-256 hex digest of its bytes
+    """
+    
+    await _require_pdf(file)
+    tmp_path, digest = await _save_upload(file)
+    try:
+        yield tmp_path, digest
+    finally:
+        Path(tmp_path).unlink(missing_ok=True)
+
+
+# Serialized responses for recently uploaded PDFs, keyed by the SHA-256 of
+# the file bytes plus the feature and its options, so re-uploads skip all
+# agent work and JSON encoding
+_results_cache = TTLCache(maxsize=RESULTS_CACHE_SIZE, ttl=RESULTS_CACHE_TTL)
+
+# Bounds the documents this worker runs through the agents at once, so a
+# burst of uploads queues instead of exhausting memory and rate limits
+JOB_SEM = asyncio.Semaphore(MAX_CONCURRENT_JOBS)
+
+
+# Clients must revalidate with If-None-Match before reusing a response
+_CACHE_HEADERS = {"Cache-Control": "private, max-age=0, must-revalidate"}
+
+
+def _etag(digest: str, feature: str, options: Tuple[Tuple[str, Any], ...]) -> str:
+    """Build the ETag of a feature response from the file digest and options"""
+    tag = "-".join([digest, feature] + [f"{key}={value}" for key, value in options])
+    return f'"{tag}"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Check whether the client already holds the response tagged etag"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return any(
+        candidate.strip().removeprefix("W/") in (etag, "*")
+        for candidate in if_none_match.split(",")
+    )
+
+
+async def _run_feature(request: Request, file: UploadFile, feature: str, **kwargs) -> Response:
+    """
+    Run a feature on an uploaded PDF, reusing the response for repeat uploads.
+    
+    Args:
+        request: Incoming request, checked for If-None-Match
+        file: Uploaded PDF
+        feature: 'document' for the full pipeline, or a single feature name
+        **kwargs: Options for the feature
+        
+    Returns:
+        JSON response with the feature results, or 304 if the client's copy
+        is current
+    """
+    
+    async with saved_pdf(file) as (tmp_path, digest):
+        options = tuple(sorted(kwargs.items()))
+        etag = _etag(digest, feature, options)
+        headers = {"ETag": etag, **_CACHE_HEADERS}
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        
+        cache_key = (digest, feature, options)
+        body = _results_cache.get(cache_key)
+        if body is not None:
+            return Response(content=body, media_type="application/json", headers=headers)
+        
+        try:
+            async with JOB_SEM:
+                if feature == "document":
+                    results = await app.state.orchestrator.process_document(pdf_path=tmp_path, **kwargs)
+                else:
+                    results = await app.state.orchestrator.process_single_feature(
+                        pdf_path=tmp_path,
+                        feature=feature,
+                        **kwargs
+                    )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    # orjson encodes the plain result dicts directly, skipping FastAPI's
+    # jsonable_encoder pass over the whole tree
+    body = orjson.dumps({"success": True, "data": results})
+    _results_cache[cache_key] = body
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @app.get("/")
@@ -46,8 +233,9 @@ async def root():
 
 @app.post("/api/process-document")
 async def process_document(
+    request: Request,
     file: UploadFile = File(...),
-    num_quiz_questions: int = 10
+    num_quiz_questions: int = Query(default=10, ge=1, le=MAX_QUIZ_QUESTIONS)
 ):
     """
     Process a PDF document through all agents.
@@ -56,148 +244,88 @@ async def process_document(
         Complete analysis including structure, highlights, explanations, and quiz
     """
     
-    if not file.filename.endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="File must be a PDF")
-    
-    # Save uploaded file temporarily
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-        content = await file.read()
-        tmp_file.write(content)
-        tmp_path = tmp_file.name
-    
-    try:
-        # Process the document
-        results = await orchestrator.process_document(
-            pdf_path=tmp_path,
-            num_quiz_questions=num_quiz_questions
-        )
-        
-        return {
-            "success": True,
-            "data": results
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-        
-    finally:
-        # Clean up temporary file
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
+    return await _run_feature(request, file, "document", num_quiz_questions=num_quiz_questions)
 
 
 @app.post("/api/structure")
-async def get_structure(file: UploadFile = File(...)):
+async def get_structure(request: Request, file: UploadFile = File(...)):
     """Get only the document structure"""
     
-    if not file.filename.endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="File must be a PDF")
-    
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-        content = await file.read()
-        tmp_file.write(content)
-        tmp_path = tmp_file.name
-    
-    try:
-        results = await orchestrator.process_single_feature(
-            pdf_path=tmp_path,
-            feature="structure"
-        )
-        return {"success": True, "data": results}
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-        
-    finally:
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
+    return await _run_feature(request, file, "structure")
 
 
 @app.post("/api/highlights")
-async def get_highlights(file: UploadFile = File(...)):
+async def get_highlights(request: Request, file: UploadFile = File(...)):
     """Get document highlights"""
     
-    if not file.filename.endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="File must be a PDF")
-    
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-        content = await file.read()
-        tmp_file.write(content)
-        tmp_path = tmp_file.name
-    
-    try:
-        results = await orchestrator.process_single_feature(
-            pdf_path=tmp_path,
-            feature="highlights"
-        )
-        return {"success": True, "data": results}
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-        
-    finally:
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
+    return await _run_feature(request, file, "highlights")
 
 
 @app.post("/api/explanations")
-async def get_explanations(file: UploadFile = File(...)):
+async def get_explanations(request: Request, file: UploadFile = File(...)):
     """Get document explanations"""
     
-    if not file.filename.endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="File must be a PDF")
-    
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-        content = await file.read()
-        tmp_file.write(content)
-        tmp_path = tmp_file.name
-    
-    try:
-        results = await orchestrator.process_single_feature(
-            pdf_path=tmp_path,
-            feature="explanations"
-        )
-        return {"success": True, "data": results}
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-        
-    finally:
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
+    return await _run_feature(request, file, "explanations")
 
 
 @app.post("/api/quiz")
 async def get_quiz(
+    request: Request,
     file: UploadFile = File(...),
-    num_questions: int = 10
+    num_questions: int = Query(default=10, ge=1, le=MAX_QUIZ_QUESTIONS)
 ):
     """Generate quiz questions"""
     
-    if not file.filename.endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="File must be a PDF")
-    
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-        content = await file.read()
-        tmp_file.write(content)
-        tmp_path = tmp_file.name
+    return await _run_feature(request, file, "quiz", num_questions=num_questions)
+
+
+async def _stream_ndjson(file: UploadFile, feature: str, **kwargs):
+    """Yield feature items of an uploaded PDF as newline-delimited JSON"""
     
-    try:
-        results = await orchestrator.process_single_feature(
-            pdf_path=tmp_path,
-            feature="quiz",
-            num_questions=num_questions
-        )
-        return {"success": True, "data": results}
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    async with saved_pdf(file) as (tmp_path, _), JOB_SEM:
+        try:
+            async for item in app.state.orchestrator.stream_feature(
+                pdf_path=tmp_path,
+                feature=feature,
+                **kwargs
+            ):
+                yield orjson.dumps(item) + b"\n"
         
-    finally:
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            yield orjson.dumps({"error": str(e)}) + b"\n"
+
+
+@app.post("/api/highlights/stream")
+async def stream_highlights(file: UploadFile = File(...)):
+    """Stream document highlights as NDJSON while they are generated"""
+    
+    # Reject bad uploads before the 200 response starts streaming
+    await _require_pdf(file)
+    
+    return StreamingResponse(
+        _stream_ndjson(file, "highlights"),
+        media_type="application/x-ndjson"
+    )
+
+
+@app.post("/api/quiz/stream")
+async def stream_quiz(
+    file: UploadFile = File(...),
+    num_questions: int = Query(default=10, ge=1, le=MAX_QUIZ_QUESTIONS)
+):
+    """Stream quiz questions as NDJSON while they are generated"""
+    
+    # Reject bad uploads before the 200 response starts streaming
+    await _require_pdf(file)
+    
+    return StreamingResponse(
+        _stream_ndjson(file, "quiz", num_questions=num_questions),
+        media_type="application/x-ndjson"
+    )
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # An import string lets uvicorn start several worker processes
+    uvicorn.run("api.main:app", host="0.0.0.0", port=8000, workers=SERVER_WORKERS)
@@ -1,5 +1,11 @@
 from typing import List, Dict, Optional
 from pydantic import BaseModel, Field
+import uuid
+
+
+def _new_id() -> str:
+    """Fallback id for items the model returned without one"""
+    return str(uuid.uuid4())
 
 
 class PageHighlight(BaseModel):
@@ -18,9 +24,14 @@ class HighlightedDocument(BaseModel):
     total_pages: int
 
 
+class HighlightResponse(BaseModel):
+    """Raw highlight response returned by the model"""
+    highlights: List[PageHighlight] = Field(default_factory=list)
+
+
 class SubTopic(BaseModel):
     """Represents a subtopic within a main topic"""
-    id: str
+    id: str = Field(default_factory=_new_id)
     title: str
     page_reference: int
     char_start: Optional[int] = None
@@ -29,16 +40,16 @@ class SubTopic(BaseModel):
 
 class Topic(BaseModel):
     """Represents a main topic with its subtopics"""
-    id: str
+    id: str = Field(default_factory=_new_id)
     title: str
-    subtopics: List[SubTopic]
+    subtopics: List[SubTopic] = Field(default_factory=list)
     page_range: List[int]
 
 
 class DocumentStructure(BaseModel):
     """Complete hierarchical structure of the document"""
-    topics: List[Topic]
-    document_title: str
+    topics: List[Topic] = Field(default_factory=list)
+    document_title: str = "Untitled Document"
 
 
 class TopicExplanation(BaseModel):
@@ -46,20 +57,20 @@ class TopicExplanation(BaseModel):
     topic_id: str
     topic_title: str
     explanation: str
-    prerequisite_concepts: List[str]
-    next_steps: List[str]
-    related_topics: List[str]
+    prerequisite_concepts: List[str] = Field(default_factory=list)
+    next_steps: List[str] = Field(default_factory=list)
+    related_topics: List[str] = Field(default_factory=list)
 
 
 class DocumentExplanations(BaseModel):
     """All explanations for the document"""
-    overarching_explanation: str
-    topic_explanations: List[TopicExplanation]
+    overarching_explanation: str = ""
+    topic_explanations: List[TopicExplanation] = Field(default_factory=list)
 
 
 class QuizChoice(BaseModel):
     """A single choice in a quiz question"""
-    choice_id: str
+    choice_id: str = Field(default_factory=_new_id)
     text: str
     is_correct: bool
     explanation: str
@@ -67,15 +78,71 @@ class QuizChoice(BaseModel):
 
 class QuizQuestion(BaseModel):
     """A complete quiz question with all choices and explanations"""
-    question_id: str
+    question_id: str = Field(default_factory=_new_id)
     question_text: str
-    choices: List[QuizChoice]
-    topic_id: str
-    difficulty: str = Field(description="easy, medium, or hard")
-    page_reference: int
+    choices: List[QuizChoice] = Field(default_factory=list)
+    topic_id: str = ""
+    difficulty: str = Field(default="medium", description="easy, medium, or hard")
+    page_reference: int = 1
 
 
 class Quiz(BaseModel):
     """Complete quiz for the document"""
     questions: List[QuizQuestion]
     total_questions: int
+
+
+# Response schemas for constrained decoding. The models above default most
+# fields so that lenient parsing never fails; sent to Gemini as a schema,
+# those defaults would make almost every field optional, so the model is
+# constrained with these copies in which every field is required instead.
+
+class HighlightResponseSchema(HighlightResponse):
+    """Highlight response schema sent to the model"""
+    highlights: List[PageHighlight]
+
+
+class SubTopicSchema(SubTopic):
+    """Subtopic schema sent to the model"""
+    id: str
+    char_start: Optional[int]
+    char_end: Optional[int]
+
+
+class TopicSchema(Topic):
+    """Topic schema sent to the model"""
+    id: str
+    subtopics: List[SubTopicSchema] = Field(min_length=1)
+
+
+class DocumentStructureSchema(DocumentStructure):
+    """Document structure schema sent to the model"""
+    topics: List[TopicSchema] = Field(min_length=1)
+    document_title: str
+
+
+class TopicExplanationSchema(TopicExplanation):
+    """Topic explanation schema sent to the model"""
+    prerequisite_concepts: List[str]
+    next_steps: List[str]
+    related_topics: List[str]
+
+
+class DocumentExplanationsSchema(DocumentExplanations):
+    """Document explanations schema sent to the model"""
+    overarching_explanation: str
+    topic_explanations: List[TopicExplanationSchema] = Field(min_length=1)
+
+
+class QuizChoiceSchema(QuizChoice):
+    """Quiz choice schema sent to the model"""
+    choice_id: str
+
+
+class QuizQuestionSchema(QuizQuestion):
+    """Quiz question schema sent to the model"""
+    question_id: str
+    choices: List[QuizChoiceSchema] = Field(min_length=4, max_length=4)
+    topic_id: str
+    difficulty: str = Field(description="easy, medium, or hard")
+    page_reference: int
@@ -1,10 +1,16 @@
-from typing import Dict, Any
-from document_processor import DocumentProcessor, PageContent
-from agents.structurization_agent import StructurizationAgent
-from agents.highlighter_agent import HighlighterAgent
-from agents.explanation_agent import ExplanationAgent
-from agents.quiz_agent import QuizAgent
-from models import (
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple, Type, TypeVar, Union
+from aiolimiter import AsyncLimiter
+from pydantic import BaseModel
+from .document_processor import DocumentProcessor, PageContent, format_structure_for_agent
+from .agents.structurization_agent import StructurizationAgent
+from .agents.highlighter_agent import HighlighterAgent
+from .agents.explanation_agent import ExplanationAgent
+from .agents.quiz_agent import QuizAgent
+from .config import EXTRACTION_PAGES_PER_TASK
+from .models import (
     DocumentStructure,
     HighlightedDocument,
     DocumentExplanations,
@@ -12,19 +18,59 @@ from models import (
 )
 
 
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+def _coerce(model_cls: Type[ModelT], value: Union[ModelT, Dict[str, Any]]) -> ModelT:
+    """Return value as a model_cls instance, validating only if it is not one already"""
+    if isinstance(value, model_cls):
+        return value
+    return model_cls.model_validate(value)
+
+
 class AgentOrchestrator:
     """
     Main orchestrator that coordinates all agents to process documents
     and generate all required outputs.
     """
     
-    def __init__(self):
-        """Initialize all agents"""
+    def __init__(
+        self,
+        max_concurrent_requests: Optional[int] = None,
+        requests_per_minute: Optional[int] = None,
+        extraction_executor: Optional[Executor] = None,
+        extraction_workers: Optional[int] = None
+    ):
+        """
+        Initialize all agents
+        
+        Args:
+            max_concurrent_requests: Cap on in-flight model requests across all agents
+            requests_per_minute: Model request rate limit across all agents
+            extraction_executor: Executor for PDF text extraction; defaults to
+                a process pool owned by this orchestrator
+            extraction_workers: Size of the default process pool; defaults to
+                one worker per CPU
+        """
+        semaphore = None
+        if max_concurrent_requests:
+            semaphore = asyncio.Semaphore(max_concurrent_requests)
+        
+        rate_limiter = None
+        if requests_per_minute:
+            rate_limiter = AsyncLimiter(requests_per_minute, 60)
+        
+        # Extraction is CPU-bound, so run it in other processes to keep the
+        # event loop and the GIL free for concurrent requests
+        self._owns_executor = extraction_executor is None
+        self.extraction_executor = extraction_executor or ProcessPoolExecutor(
+            max_workers=extraction_workers or os.cpu_count()
+        )
         self.doc_processor = DocumentProcessor()
-        self.structurization_agent = StructurizationAgent()
-        self.highlighter_agent = HighlighterAgent()
-        self.explanation_agent = ExplanationAgent()
-        self.quiz_agent = QuizAgent()
+        self.structurization_agent = StructurizationAgent(semaphore, rate_limiter)
+        self.highlighter_agent = HighlighterAgent(semaphore, rate_limiter)
+        self.explanation_agent = ExplanationAgent(semaphore, rate_limiter)
+        self.quiz_agent = QuizAgent(semaphore, rate_limiter)
         
     async def process_document(
         self,
@@ -48,50 +94,126 @@ class AgentOrchestrator:
         
         # Step 1: Extract text from PDF
         print("📄 Extracting text from PDF...")
-        pages = self.doc_processor.extract_text_from_pdf(pdf_path)
+        pages = await self._extract_pages(pdf_path)
         formatted_doc = self.doc_processor.format_document_for_agent(pages)
         
         # Step 2: Analyze document structure
         print("🗂️  Analyzing document structure...")
         structure = await self.structurization_agent.analyze_structure(formatted_doc)
         
-        # Step 3: Highlight important sections (requires structure)
+        # Serialize the structure once; every remaining prompt embeds it
+        topics_json = format_structure_for_agent(structure)
+        
+        # Steps 3-5: Explanations need the highlights, but the quiz only needs
+        # the structure, so the quiz runs alongside the highlight and
+        # explanation chain. return_exceptions lets the sibling call finish
+        # instead of being cancelled on a failure.
         print("✨ Highlighting important sections...")
+        print("❓ Generating quiz questions...")
+        highlights_and_explanations, quiz = await asyncio.gather(
+            self._highlight_and_explain(formatted_doc, structure, pages, topics_json),
+            self.quiz_agent.generate_quiz(
+                formatted_doc,
+                structure,
+                num_quiz_questions,
+                topics_json
+            ),
+            return_exceptions=True
+        )
+        for result in (highlights_and_explanations, quiz):
+            if isinstance(result, BaseException):
+                raise result
+        highlights, explanations = highlights_and_explanations
+        
+        print("✅ Document processing complete!")
+        
+        # Dumping large highlight and quiz trees is CPU work; do it off the
+        # event loop so other requests keep being served meanwhile
+        return await asyncio.to_thread(
+            self._assemble_results, pages, structure, highlights, explanations, quiz
+        )
+    
+    async def _highlight_and_explain(
+        self,
+        formatted_doc: str,
+        structure: DocumentStructure,
+        pages: List[PageContent],
+        topics_json: str
+    ) -> Tuple[HighlightedDocument, DocumentExplanations]:
+        """Highlight the document, then explain it using those highlights"""
+        
         highlights = await self.highlighter_agent.highlight_document(
             formatted_doc,
             structure,
-            pages
+            pages,
+            topics_json
         )
         
-        # Step 4: Generate explanations (requires structure and highlights)
         print("📚 Generating explanations...")
         explanations = await self.explanation_agent.generate_explanations(
             formatted_doc,
             structure,
-            highlights
+            highlights,
+            topics_json,
+            pages
         )
         
-        # Step 5: Generate quiz (requires structure)
-        print("❓ Generating quiz questions...")
-        quiz = await self.quiz_agent.generate_quiz(
-            formatted_doc,
-            structure,
-            num_quiz_questions
+        return highlights, explanations
+    
+    async def _extract_pages(self, pdf_path: str) -> List[PageContent]:
+        """
+        Extract PDF text in the extraction executor so other requests keep
+        running. Large PDFs are split into page ranges extracted in parallel.
+        """
+        
+        loop = asyncio.get_running_loop()
+        page_count = await loop.run_in_executor(
+            self.extraction_executor,
+            self.doc_processor.count_pages,
+            pdf_path
         )
         
-        print("✅ Document processing complete!")
+        page_ranges = await asyncio.gather(*[
+            loop.run_in_executor(
+                self.extraction_executor,
+                self.doc_processor.extract_page_range,
+                pdf_path,
+                start,
+                min(start + EXTRACTION_PAGES_PER_TASK, page_count)
+            )
+            for start in range(0, page_count, EXTRACTION_PAGES_PER_TASK)
+        ])
+        return [page for pages in page_ranges for page in pages]
+    
+    def shutdown(self):
+        """Release the extraction process pool if this orchestrator created it"""
+        if self._owns_executor:
+            self.extraction_executor.shutdown()
+    
+    def _assemble_results(
+        self,
+        pages: List[PageContent],
+        structure: DocumentStructure,
+        highlights: HighlightedDocument,
+        explanations: DocumentExplanations,
+        quiz: Quiz
+    ) -> Dict[str, Any]:
+        """Combine all agent outputs into the full document result"""
+        
+        # Read the counts off the models directly rather than the dumped dicts
+        metadata = {
+            "total_pages": len(pages),
+            "total_topics": len(structure.topics),
+            "total_highlights": len(highlights.highlights),
+            "total_questions": quiz.total_questions
+        }
         
         return {
             "structure": structure.model_dump(),
             "highlights": highlights.model_dump(),
             "explanations": explanations.model_dump(),
             "quiz": quiz.model_dump(),
-            "metadata": {
-                "total_pages": len(pages),
-                "total_topics": len(structure.topics),
-                "total_highlights": len(highlights.highlights),
-                "total_questions": quiz.total_questions
-            }
+            "metadata": metadata
         }
     
     async def process_single_feature(
@@ -112,7 +234,7 @@ class AgentOrchestrator:
             Output from the requested feature
         """
         
-        pages = self.doc_processor.extract_text_from_pdf(pdf_path)
+        pages = await self._extract_pages(pdf_path)
         formatted_doc = self.doc_processor.format_document_for_agent(pages)
         
         if feature == "structure":
@@ -125,7 +247,7 @@ class AgentOrchestrator:
             if not structure_data:
                 structure = await self.structurization_agent.analyze_structure(formatted_doc)
             else:
-                structure = DocumentStructure(**structure_data)
+                structure = _coerce(DocumentStructure, structure_data)
             
             highlights = await self.highlighter_agent.highlight_document(
                 formatted_doc,
@@ -142,21 +264,26 @@ class AgentOrchestrator:
             if not structure_data:
                 structure = await self.structurization_agent.analyze_structure(formatted_doc)
             else:
-                structure = DocumentStructure(**structure_data)
+                structure = _coerce(DocumentStructure, structure_data)
+            
+            topics_json = format_structure_for_agent(structure)
             
             if not highlights_data:
                 highlights = await self.highlighter_agent.highlight_document(
                     formatted_doc,
                     structure,
-                    pages
+                    pages,
+                    topics_json
                 )
             else:
-                highlights = HighlightedDocument(**highlights_data)
+                highlights = _coerce(HighlightedDocument, highlights_data)
             
             explanations = await self.explanation_agent.generate_explanations(
                 formatted_doc,
                 structure,
-                highlights
+                highlights,
+                topics_json,
+                pages
             )
             return {"explanations": explanations.model_dump()}
         
@@ -166,7 +293,7 @@ class AgentOrchestrator:
             if not structure_data:
                 structure = await self.structurization_agent.analyze_structure(formatted_doc)
             else:
-                structure = DocumentStructure(**structure_data)
+                structure = _coerce(DocumentStructure, structure_data)
             
             num_questions = kwargs.get("num_questions", 10)
             quiz = await self.quiz_agent.generate_quiz(
@@ -178,3 +305,48 @@ class AgentOrchestrator:
         
         else:
             raise ValueError(f"Unknown feature: {feature}")
+    
+    async def stream_feature(
+        self,
+        pdf_path: str,
+        feature: str,
+        **kwargs
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream the items of a list feature as the model generates them.
+        
+        Args:
+            pdf_path: Path to the PDF file
+            feature: One of 'highlights', 'quiz'
+            **kwargs: Additional arguments for specific features
+            
+        Yields:
+            Each highlight or quiz question as a dictionary
+        """
+        
+        if feature not in ("highlights", "quiz"):
+            raise ValueError(f"Feature cannot be streamed: {feature}")
+        
+        pages = await self._extract_pages(pdf_path)
+        formatted_doc = self.doc_processor.format_document_for_agent(pages)
+        
+        structure_data = kwargs.get("structure")
+        if not structure_data:
+            structure = await self.structurization_agent.analyze_structure(formatted_doc)
+        else:
+            structure = _coerce(DocumentStructure, structure_data)
+        
+        if feature == "highlights":
+            items = self.highlighter_agent.stream_document_highlights(
+                structure,
+                pages
+            )
+        else:
+            items = self.quiz_agent.stream_quiz(
+                formatted_doc,
+                structure,
+                kwargs.get("num_questions", 10)
+            )
+        
+        async for item in items:
+            yield item.model_dump()
@@ -1,12 +1,10 @@
 """
 Start the API server with proper configuration
+
+Run from the repository root:
+    python -m api.start_server
 """
 import uvicorn
-import sys
-import os
-
-# Add current directory to path
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 if __name__ == "__main__":
     print("=" * 60)
@@ -19,7 +17,7 @@ if __name__ == "__main__":
     print("=" * 60)
     
     uvicorn.run(
-        "api_server:app",
+        "api.main:app",
         host="0.0.0.0",
         port=8000,
         reload=True,  # Auto-reload on code changes
@@ -1,8 +1,11 @@
 """
 Simple test to verify the server is working correctly
+
+Run from the repository root:
+    python -m api.test_server
 """
 import asyncio
-from orchestrator import AgentOrchestrator
+from api.orchestrator import AgentOrchestrator
 
 
 async def test_initialization():
@@ -2,7 +2,7 @@
 
 import os
 from typing import List, Dict, Optional, Tuple
-import PyPDF2
+import pypdfium2 as pdfium
 from sentence_transformers import SentenceTransformer
 import chromadb
 from chromadb.config import Settings
@@ -10,49 +10,108 @@ import numpy as np
 from dataclasses import dataclass
 import hashlib
 import json
+import re
 
 
-def extract_text_from_pdf(self, pdf_path: str) -> List[Dict]:
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+
+
+@dataclass
+class DocumentChunk:
+    """Represents a chunk of text from a document"""
+    text: str
+    page_number: int
+    chunk_index: int
+    metadata: Dict
+
+
+def extract_text_from_pdf(pdf_path: str) -> List[Dict]:
     pages_data = []
     
-    with open(pdf_path, 'rb') as file:
-        pdf_reader = PyPDF2.PdfReader(file)
-        
-        for page_num, page in enumerate(pdf_reader.pages):
-            text = page.extract_text()
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        for page_num in range(len(pdf)):
+            page = pdf[page_num]
+            textpage = page.get_textpage()
+            text = textpage.get_text_range().replace('\r\n', '\n')
+            textpage.close()
+            page.close()
             
             if text.strip():  # Only add non-empty pages
                 pages_data.append({
                     'page_number': page_num + 1,
                     'text': text.strip()
                 })
+    finally:
+        pdf.close()
     
     return pages_data
-def chunk_text(self, pages_data, chunk_size=512, overlap=50):
+
+
+def _split_into_sentences(text: str) -> List[str]:
+    return [s for s in _SENTENCE_SPLIT_RE.split(text) if s.strip()]
+
+
+# Same overlap rule as _overlap_tail in vectorize-rag/pdf_processor.py;
+# keep the two in step so both chunkers produce identical chunks
+def _overlap_tail(text: str, overlap: int) -> str:
+    if overlap <= 0:
+        return ""
+    cut = len(text) - overlap
+    if cut <= 0:
+        return text
+    tail = text[cut:]
+    if not text[cut - 1].isspace():
+        # Drop the partial word the cut landed in
+        parts = tail.split(None, 1)
+        tail = parts[1] if len(parts) > 1 else ""
+    return tail.strip()
+
+
+def chunk_text(pages_data, chunk_size=512, overlap=50):
     chunks = []
+    chunk_counter = 0
     
     for page_data in pages_data:
         text = page_data['text']
         page_num = page_data['page_number']
         
         # Split into sentences
-        sentences = self._split_into_sentences(text)
+        sentences = _split_into_sentences(text)
         
-        current_chunk = ""
+        # Collect sentences in a list and join once per chunk; repeated
+        # string concatenation would copy the chunk for every sentence
+        buffer = []
+        buffer_len = 0  # length of " ".join(buffer) plus a trailing space
         
         for sentence in sentences:
             # If adding this sentence exceeds limit, save chunk
-            if len(current_chunk) + len(sentence) > chunk_size:
+            if buffer and buffer_len + len(sentence) > chunk_size:
+                current_chunk = " ".join(buffer)
                 chunks.append(DocumentChunk(
-                    text=current_chunk.strip(),
+                    text=current_chunk,
                     page_number=page_num,
                     chunk_index=chunk_counter,
-                    metadata={'char_count': len(current_chunk)}
+                    metadata={'char_count': buffer_len}
                 ))
+                chunk_counter += 1
                 
                 # Keep overlap from previous chunk
-                words = current_chunk.split()
-                overlap_words = int(len(words) * (overlap / chunk_size))
-                current_chunk = " ".join(words[-overlap_words:]) + " "
+                tail = _overlap_tail(current_chunk, overlap)
+                buffer = [tail] if tail else []
+                buffer_len = len(tail) + 1 if tail else 0
             
-            current_chunk += sentence + " "
+            buffer.append(sentence)
+            buffer_len += len(sentence) + 1
+        
+        # Add remaining text as final chunk for this page
+        if buffer:
+            chunks.append(DocumentChunk(
+                text=" ".join(buffer),
+                page_number=page_num,
+                chunk_index=chunk_counter,
+                metadata={'char_count': buffer_len}
+            ))
+            chunk_counter += 1
+    
+    return chunks
@@ -8,16 +8,15 @@ run offline without network access.
 
 from __future__ import annotations
 
-import itertools
+import functools
 import json
 import os
 import random
 import re
 from dataclasses import dataclass
+from pathlib import Path
 from typing import Dict, List, Sequence
 
-_ENV_LOADED = False
-
 try:
     import google.generativeai as genai
 except Exception:  # pragma: no cover - package might not be installed.
@@ -26,6 +25,24 @@ except Exception:  # pragma: no cover - package might not be installed.
 DEFAULT_MODEL = "gemini-1.5-flash"
 BASE_DIR = os.path.dirname(__file__)
 
+_JSON_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")
+
+# Random draws per question before distractor sampling falls back to a scan
+_MAX_DISTRACTOR_DRAWS = 32
+
+# Static parts of the quiz prompt; only the question count and context vary
+_PROMPT_PREFIX = "You are an AI tutor helping students practice key ideas."
+_PROMPT_SUFFIX = """Each item must be a JSON object in this exact format:
+{
+  "question": "...?",
+  "answer": "text of the correct answer taken verbatim from the context",
+  "options": ["A", "B", "C", "D"],
+  "context": "one or two sentences from the source that justify the answer"
+}
+
+Return ONLY a JSON array (no prose, no markdown). Base every answer strictly on the provided context."""
+
 
 @dataclass
 class QuizQuestion:
@@ -60,7 +77,6 @@ class GeminiService:
         model_name: str = DEFAULT_MODEL,
         request_timeout: int = 30,
     ) -> None:
-        self._ensure_env_loaded()
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
         self.model_name = model_name
         self.request_timeout = request_timeout
@@ -113,31 +129,20 @@ class GeminiService:
         return [self._normalize_question(item) for item in questions]
 
     @staticmethod
+    @functools.lru_cache(maxsize=128)
     def _build_prompt(context: str, num_questions: int) -> str:
-        return f"""
-You are an AI tutor helping students practice key ideas.
-
-Read the following context and create {num_questions} multiple-choice questions.
-Each item must be a JSON object in this exact format:
-{{
-  "question": "...?",
-  "answer": "text of the correct answer taken verbatim from the context",
-  "options": ["A", "B", "C", "D"],
-  "context": "one or two sentences from the source that justify the answer"
-}}
-
-Return ONLY a JSON array (no prose, no markdown). Base every answer strictly on the provided context.
-
-Context:
-\"\"\"
-{context}
-\"\"\"
-""".strip()
+        # Cached so retries with the same context reuse the built prompt.
+        return (
+            f"{_PROMPT_PREFIX}\n\n"
+            f"Read the following context and create {num_questions} multiple-choice questions.\n"
+            f"{_PROMPT_SUFFIX}\n\n"
+            f'Context:\n"""\n{context}\n"""'
+        )
 
     @staticmethod
     def _extract_json_block(text: str) -> str:
         """Extract JSON content, handling optional ```json fences."""
-        fenced_match = re.search(r"```(?:json)?\s*(.*?)```", text, flags=re.DOTALL)
+        fenced_match = _JSON_FENCE_RE.search(text)
         block = fenced_match.group(1).strip() if fenced_match else text.strip()
         return block
 
@@ -172,10 +177,12 @@ Context:
         rng = random.Random(42)
         questions: List[QuizQuestion] = []
 
-        for sentence in itertools.islice(itertools.cycle(sentences), num_questions):
+        for k in range(num_questions):
+            index = k % len(sentences)
+            sentence = sentences[index]
             answer = sentence
             question = f"What does the following statement describe? \"{sentence}\""
-            distractors = self._sample_distractors(rng, sentences, exclude=sentence)
+            distractors = self._sample_distractors(rng, sentences, exclude_index=index)
             options = [answer] + distractors
             rng.shuffle(options)
 
@@ -194,16 +201,30 @@ Context:
     def _tokenize_sentences(text: str) -> List[str]:
         sentences = [
             s.strip()
-            for s in re.split(r"(?<=[.!?])\s+", text)
+            for s in _SENTENCE_SPLIT_RE.split(text)
             if s.strip()
         ]
         return sentences
 
     @staticmethod
-    def _sample_distractors(rng: random.Random, sentences: Sequence[str], exclude: str) -> List[str]:
-        distractor_pool = [s for s in sentences if s != exclude]
+    def _sample_distractors(rng: random.Random, sentences: Sequence[str], exclude_index: int) -> List[str]:
+        exclude = sentences[exclude_index]
         filler = "The statement is unrelated to the topic."
 
+        # Draw random indices and reject the answer instead of rebuilding the
+        # candidate list for every question. Repeated sentences can make
+        # rejections pile up, so give up after a few draws and filter instead.
+        if len(sentences) > 3:
+            picked: List[int] = []
+            for _ in range(_MAX_DISTRACTOR_DRAWS):
+                j = rng.randrange(len(sentences))
+                if j != exclude_index and j not in picked and sentences[j] != exclude:
+                    picked.append(j)
+                    if len(picked) == 3:
+                        return [sentences[j] for j in picked]
+
+        distractor_pool = [s for s in sentences if s != exclude]
+
         if len(distractor_pool) >= 3:
             return rng.sample(distractor_pool, 3)
         else:
@@ -212,37 +233,37 @@ Context:
                 sampled.append(filler)
             return sampled
 
-    @staticmethod
-    def _ensure_env_loaded() -> None:
-        """Load .env/.env.local files sitting next to this module if present."""
-        global _ENV_LOADED
-        if _ENV_LOADED:
-            return
-
-        for filename in (".env", ".env.local"):
-            path = os.path.join(BASE_DIR, filename)
-            if not os.path.exists(path):
+
+def _load_env_files() -> None:
+    """Load .env/.env.local files sitting next to this module if present."""
+    values: Dict[str, str] = {}
+    for filename in (".env", ".env.local"):
+        try:
+            text = (Path(BASE_DIR) / filename).read_text(encoding="utf-8")
+        except OSError:
+            continue
+
+        for raw_line in text.splitlines():
+            line = raw_line.strip()
+            if not line or line.startswith("#"):
                 continue
-            try:
-                with open(path, "r", encoding="utf-8") as handle:
-                    for raw_line in handle:
-                        line = raw_line.strip()
-                        if not line or line.startswith("#"):
-                            continue
-                        if "=" in line:
-                            key, value = line.split("=", 1)
-                        elif ":" in line:
-                            key, value = line.split(":", 1)
-                        else:
-                            continue
-                        key = key.strip()
-                        value = value.strip().strip('"').strip("'")
-                        if key and value and key not in os.environ:
-                            os.environ[key] = value
-            except OSError:
+            if "=" in line:
+                key, value = line.split("=", 1)
+            elif ":" in line:
+                key, value = line.split(":", 1)
+            else:
                 continue
+            key = key.strip()
+            value = value.strip().strip('"').strip("'")
+            if key and value:
+                # Earlier files take precedence, as does the real environment
+                values.setdefault(key, value)
+
+    os.environ.update({k: v for k, v in values.items() if k not in os.environ})
+
 
-        _ENV_LOADED = True
+# Runs once per process, before any GeminiService reads the API key
+_load_env_files()
 
 
 __all__ = ["GeminiService", "QuizQuestion"]
@@ -13,15 +13,16 @@ from vectorization import VectorStore
 class RAGSystem:
     """Main RAG system combining PDF processing and vector retrieval"""
     
-    def __init__(self, persist_directory: str = "./chroma_db"):
+    def __init__(self, persist_directory: str = "./chroma_db", backend: str = "chroma"):
         """
         Initialize RAG system
         
         Args:
             persist_directory: Where to persist the vector database
+            backend: Vector store backend, 'chroma' or 'mem' (see VectorStore)
         """
         self.pdf_processor = PDFProcessor()
-        self.vector_store = VectorStore(persist_directory=persist_directory)
+        self.vector_store = VectorStore(persist_directory=persist_directory, backend=backend)
     
     def process_pdf(self, pdf_path: str, document_id: Optional[str] = None) -> str:
         """
@@ -34,22 +35,35 @@ class RAGSystem:
         Returns:
             document_id used for storage
         """
+        # Read the file once; its hash detects edits to an indexed PDF,
+        # and the same bytes are parsed below
+        pdf_bytes = self._read_file(pdf_path)
+        file_hash = hashlib.sha256(pdf_bytes).hexdigest() if pdf_bytes is not None else None
+        
         # Generate document ID if not provided
         if document_id is None:
             document_id = self._generate_document_id(pdf_path)
         
-        print(f"Processing PDF: {pdf_path}")
+        # The vector store persists across runs, so unchanged PDFs are
+        # only embedded once
+        if self.vector_store.has_document(document_id, file_hash):
+            print(f"PDF already indexed as {document_id}: {pdf_path}")
+            return document_id
         
-        # Extract text from PDF
-        pages_data = self.pdf_processor.extract_text_from_pdf(pdf_path)
-        print(f"Extracted text from {len(pages_data)} pages")
+        # Drop chunks stored for an older version of this document, or left
+        # behind by an indexing run that did not finish
+        if file_hash is not None and self.vector_store.has_document(document_id):
+            self.vector_store.delete_document(document_id)
         
-        # Chunk the text
-        chunks = self.pdf_processor.chunk_text(pages_data)
-        print(f"Created {len(chunks)} chunks")
+        print(f"Processing PDF: {pdf_path}")
         
-        # Add to vector store
-        self.vector_store.add_documents(chunks, document_id)
+        # Extract, chunk and embed as a lazy pipeline, so only one page and
+        # one batch of chunks are held in memory at a time
+        pages_data = self.pdf_processor.extract_text_from_pdf(
+            pdf_path if pdf_bytes is None else pdf_bytes
+        )
+        chunks = self.pdf_processor.chunk_text(pages_data)
+        self.vector_store.add_documents(chunks, document_id, file_hash)
         
         return document_id
     
@@ -102,6 +116,14 @@ class RAGSystem:
         
         return "\n".join(context_parts)
     
+    def _read_file(self, pdf_path: str) -> Optional[bytes]:
+        """Contents of a file, or None if it is missing"""
+        try:
+            with open(pdf_path, 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+    
     def _generate_document_id(self, pdf_path: str) -> str:
         """Generate unique document ID from file path"""
         filename = os.path.basename(pdf_path)
@@ -8,8 +8,13 @@ from __future__ import annotations
 import chromadb
 import os
 import numpy as np
+import operator
 import re
-from typing import Callable, Dict, List, Optional
+import xxhash
+from cachetools import LRUCache
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Dict, Iterable, List, Optional
 from pdf_processor import DocumentChunk
 
 try:  # sentence-transformers requires downloading models, so we guard the import.
@@ -17,6 +22,28 @@ try:  # sentence-transformers requires downloading models, so we guard the impor
 except Exception:  # pragma: no cover - falls back when dependency missing/offline.
     SentenceTransformer = None
 
+try:  # numba is optional; SimpleEmbedder falls back to numpy without it.
+    from numba import njit, prange
+except ImportError:  # pragma: no cover - numba not installed.
+    njit = None
+
+# Number of texts per SentenceTransformer forward pass
+EMBED_BATCH_SIZE = 64
+
+# Number of chunks embedded and inserted into Chroma at a time
+ADD_BATCH_SIZE = 256
+
+# Number of recent query embeddings kept per VectorStore
+QUERY_CACHE_SIZE = 1024
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# bytes.translate table for ASCII text: every byte that \w does not match
+# becomes a space, so splitting yields exactly the tokens of _TOKEN_RE
+_TOKEN_BYTES = bytes(
+    byte if chr(byte).isalnum() or byte == ord("_") else 0x20 for byte in range(128)
+) + bytes(range(128, 256))
+
 USE_SENTENCE_TRANSFORMER = os.getenv("SENSEI_USE_SENTENCE_TRANSFORMER", "").lower() in {
     "1",
     "true",
@@ -24,28 +51,225 @@ USE_SENTENCE_TRANSFORMER = os.getenv("SENSEI_USE_SENTENCE_TRANSFORMER", "").lowe
 }
 
 
+if njit is not None:
+
+    @njit(parallel=True, cache=True)
+    def _scatter_normalized(offsets: np.ndarray, col_ids: np.ndarray, dimension: int) -> np.ndarray:
+        """Count each row's bucket ids into a matrix and L2-normalize the rows"""
+        n = offsets.shape[0] - 1
+        matrix = np.zeros((n, dimension), dtype=np.float32)
+        for row in prange(n):
+            for j in range(offsets[row], offsets[row + 1]):
+                matrix[row, col_ids[j]] += 1.0
+            norm = np.sqrt(np.sum(matrix[row] * matrix[row]))
+            if norm > 0:
+                matrix[row] /= norm
+        return matrix
+
+else:
+
+    def _scatter_normalized(offsets: np.ndarray, col_ids: np.ndarray, dimension: int) -> np.ndarray:
+        """Count each row's bucket ids into a matrix and L2-normalize the rows"""
+        n = offsets.shape[0] - 1
+        row_ids = np.repeat(np.arange(n), np.diff(offsets))
+        matrix = np.zeros((n, dimension), dtype=np.float32)
+        np.add.at(matrix, (row_ids, col_ids), 1.0)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms > 0, norms, 1.0)
+        return matrix
+
+
 class SimpleEmbedder:
     """
     Offline-friendly fallback embedder using a hashed bag-of-words vector.
     Provides deterministic embeddings without needing to download HF models.
+
+    Tokens are bucketed with a seeded xxh3 hash, so vectors are identical
+    across processes and restarts. Vectors stored before the switch from
+    Python's per-process randomized hash() do not match these and the
+    documents should be re-added.
+
+    Tokens are the \\w+ runs of the lower-cased text. ASCII text takes a
+    faster bytes.translate and split that produces the same tokens, already
+    as the UTF-8 bytes the hash needs.
     """
 
-    def __init__(self, dimension: int = 384):
+    def __init__(self, dimension: int = 384, hash_seed: int = 0):
         self.dimension = dimension
+        self.hash_seed = hash_seed
+
+    def _tokenize(self, text: str) -> List[bytes]:
+        """Lower-case a text and split it into UTF-8 encoded tokens"""
+        text = text.lower()
+        if text.isascii():
+            return text.encode().translate(_TOKEN_BYTES).split()
+        # The regex separates Unicode punctuation such as curly quotes,
+        # bullets and dashes from the words around them
+        return [token.encode() for token in _TOKEN_RE.findall(text)]
 
     def encode(self, texts: List[str], convert_to_numpy: bool = True) -> np.ndarray:
-        vectors = []
-        for text in texts:
-            vec = np.zeros(self.dimension, dtype=np.float32)
-            tokens = re.findall(r"\w+", text.lower())
-            for token in tokens:
-                idx = hash(token) % self.dimension
-                vec[idx] += 1.0
-            norm = np.linalg.norm(vec)
-            if norm > 0:
-                vec /= norm
-            vectors.append(vec)
-        return np.stack(vectors) if convert_to_numpy else vectors
+        token_lists = [self._tokenize(text) for text in texts]
+        token_counts = [len(tokens) for tokens in token_lists]
+
+        # Hash every token of the batch once, then scatter all counts into
+        # the matrix in a single pass instead of one scalar add per token
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum(token_counts, out=offsets[1:])
+        hash_token = xxhash.xxh3_64_intdigest
+        seed = self.hash_seed
+        col_ids = (np.fromiter(
+            (hash_token(token, seed) for tokens in token_lists for token in tokens),
+            dtype=np.uint64,
+            count=offsets[-1],
+        ) % np.uint64(self.dimension)).astype(np.int64)
+
+        matrix = _scatter_normalized(offsets, col_ids, self.dimension)
+        return matrix if convert_to_numpy else list(matrix)
+
+
+# Chroma's where comparison operators, as (stored value, operand) predicates
+_WHERE_OPERATORS: Dict[str, Callable[[object, object], bool]] = {
+    "$eq": operator.eq,
+    "$ne": operator.ne,
+    "$gt": operator.gt,
+    "$gte": operator.ge,
+    "$lt": operator.lt,
+    "$lte": operator.le,
+    "$in": lambda value, options: value in options,
+    "$nin": lambda value, options: value not in options,
+}
+
+
+def _where_predicate(where: Optional[Dict]) -> Callable[[Dict], bool]:
+    """
+    Compile a Chroma where filter into a metadata predicate.
+
+    Supports field equality, the comparison operators in _WHERE_OPERATORS
+    and $and / $or. Like Chroma, a field condition never matches metadata
+    that lacks the field. Any other operator raises ValueError instead of
+    silently matching nothing.
+    """
+    if not where:
+        return lambda metadata: True
+
+    predicates = []
+    for key, condition in where.items():
+        if key in ("$and", "$or"):
+            clauses = [_where_predicate(clause) for clause in condition]
+            combine = all if key == "$and" else any
+            predicates.append(
+                lambda metadata, clauses=clauses, combine=combine:
+                    combine(clause(metadata) for clause in clauses)
+            )
+        elif key.startswith("$"):
+            raise ValueError(f"Unsupported where operator: {key}")
+        else:
+            predicates.append(_field_predicate(key, condition))
+    return lambda metadata: all(predicate(metadata) for predicate in predicates)
+
+
+def _field_predicate(key: str, condition) -> Callable[[Dict], bool]:
+    """Compile the condition on one metadata field of a where filter"""
+    if not isinstance(condition, dict):
+        condition = {"$eq": condition}
+
+    comparisons = []
+    for op, operand in condition.items():
+        if op not in _WHERE_OPERATORS:
+            raise ValueError(f"Unsupported where operator for '{key}': {op}")
+        comparisons.append((_WHERE_OPERATORS[op], operand))
+
+    def predicate(metadata: Dict) -> bool:
+        if key not in metadata:
+            return False
+        value = metadata[key]
+        return all(compare(value, operand) for compare, operand in comparisons)
+
+    return predicate
+
+
+class InMemoryCollection:
+    """
+    Brute-force cosine search over a contiguous embedding matrix, for
+    collections small enough to keep in RAM. Mirrors the subset of the
+    Chroma collection API that VectorStore uses, but is not persisted.
+
+    Rows are kept as float32 rather than float16: numpy has no BLAS kernel
+    for float16, and scoring a float16 matrix measured about 7x slower.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._blocks: List[np.ndarray] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._documents: List[str] = []
+        self._metadatas: List[Dict] = []
+        self._ids: List[str] = []
+
+    def _embeddings(self) -> np.ndarray:
+        """All stored rows as one matrix, stacked once after each change"""
+        if self._matrix is None:
+            self._matrix = np.vstack(self._blocks) if self._blocks else None
+            self._blocks = [self._matrix] if self._matrix is not None else []
+        return self._matrix
+
+    def add(self, embeddings: np.ndarray, documents: List[str], metadatas: List[Dict], ids: List[str]):
+        self._blocks.append(np.asarray(embeddings, dtype=np.float32))
+        self._matrix = None
+        self._documents.extend(documents)
+        self._metadatas.extend(metadatas)
+        self._ids.extend(ids)
+
+    def get(self, where: Optional[Dict] = None, limit: Optional[int] = None, include=None) -> Dict:
+        matches = _where_predicate(where)
+        ids = [id_ for id_, metadata in zip(self._ids, self._metadatas) if matches(metadata)]
+        return {'ids': ids[:limit]}
+
+    def delete(self, where: Optional[Dict] = None):
+        matches = _where_predicate(where)
+        keep = [i for i, metadata in enumerate(self._metadatas) if not matches(metadata)]
+        if len(keep) == len(self._ids):
+            return
+        matrix = self._embeddings()
+        self._blocks = [matrix[keep]] if keep else []
+        self._matrix = None
+        self._documents = [self._documents[i] for i in keep]
+        self._metadatas = [self._metadatas[i] for i in keep]
+        self._ids = [self._ids[i] for i in keep]
+
+    def count(self) -> int:
+        return len(self._ids)
+
+    def query(self, query_embeddings: np.ndarray, n_results: int, where: Optional[Dict] = None) -> Dict:
+        results = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        matrix = self._embeddings()
+        if where:
+            matches = _where_predicate(where)
+            rows = np.array(
+                [i for i, metadata in enumerate(self._metadatas) if matches(metadata)],
+                dtype=np.int64
+            )
+        else:
+            rows = np.arange(len(self._ids))
+
+        for query_embedding in np.asarray(query_embeddings, dtype=np.float32):
+            top = np.array([], dtype=np.int64)
+            distances = np.array([], dtype=np.float32)
+            if len(rows):
+                # Rows and queries are unit-normalized, so the dot product is
+                # the cosine similarity; Chroma reports 1 - similarity
+                candidates = matrix if len(rows) == len(self._ids) else matrix[rows]
+                scores = candidates @ query_embedding
+                k = min(n_results, len(rows))
+                top = np.argpartition(-scores, k - 1)[:k]
+                top = top[np.argsort(-scores[top])]
+                distances = 1.0 - scores[top]
+                top = rows[top]
+            results['ids'].append([self._ids[i] for i in top])
+            results['documents'].append([self._documents[i] for i in top])
+            results['metadatas'].append([self._metadatas[i] for i in top])
+            results['distances'].append(distances.tolist())
+        return results
 
 
 class VectorStore:
@@ -54,7 +278,8 @@ class VectorStore:
     def __init__(self, 
                  collection_name: str = "sensei_notes",
                  model_name: str = "all-MiniLM-L6-v2",
-                 persist_directory: str = "./chroma_db"):
+                 persist_directory: str = "./chroma_db",
+                 backend: str = "chroma"):
         """
         Initialize vector store
         
@@ -62,9 +287,19 @@ class VectorStore:
             collection_name: Name for the vector collection
             model_name: SentenceTransformer model to use for embeddings
             persist_directory: Where to persist the vector database
+            backend: 'chroma' for the persistent ChromaDB collection, or 'mem'
+                for an in-process InMemoryCollection (not persisted)
         """
         self.embed_fn: Callable[[List[str]], np.ndarray]
         self._initialize_embedder(model_name)
+        self._query_cache: LRUCache = LRUCache(maxsize=QUERY_CACHE_SIZE)
+        
+        if backend == "mem":
+            self.client = None
+            self.collection = InMemoryCollection(collection_name)
+            return
+        if backend != "chroma":
+            raise ValueError(f"Unknown vector store backend '{backend}', expected 'chroma' or 'mem'")
         
         # Initialize ChromaDB client
         self.client = chromadb.PersistentClient(path=persist_directory)
@@ -82,9 +317,20 @@ class VectorStore:
         """
         if USE_SENTENCE_TRANSFORMER and SentenceTransformer is not None:
             try:
-                model = SentenceTransformer(model_name)
+                import torch
+
+                device = "cuda" if torch.cuda.is_available() else "cpu"
+                model = SentenceTransformer(model_name, device=device)
+                if device == "cuda":
+                    model.half()  # FP16 halves memory traffic on tensor cores
                 self.embedding_dimension = model.get_sentence_embedding_dimension()
-                self.embed_fn = lambda texts: model.encode(texts, convert_to_numpy=True)
+                self.embed_fn = lambda texts: model.encode(
+                    texts,
+                    batch_size=EMBED_BATCH_SIZE,
+                    convert_to_numpy=True,
+                    normalize_embeddings=True,
+                    show_progress_bar=False,
+                )
                 print(f"Loaded SentenceTransformer model '{model_name}'.")
                 return
             except OSError as exc:
@@ -113,43 +359,91 @@ class VectorStore:
             "for offline vectorization."
         )
         
-    def add_documents(self, chunks: List[DocumentChunk], document_id: str):
+    def add_documents(self,
+                      chunks: Iterable[DocumentChunk],
+                      document_id: str,
+                      file_hash: Optional[str] = None) -> int:
         """
         Add document chunks to vector store
         
+        Chunks are consumed lazily and embedded and inserted ADD_BATCH_SIZE
+        at a time. Each insert runs on a background thread while the next
+        batch is read and embedded, so at most three batches are held in
+        memory. The final chunk is marked with index_complete, so a document
+        whose indexing was interrupted is not mistaken for a finished one.
+        
         Args:
-            chunks: List of DocumentChunk objects
+            chunks: Iterable of DocumentChunk objects
             document_id: Unique identifier for the source document
+            file_hash: Optional digest of the source file, stored with each chunk
+            
+        Returns:
+            Number of chunks added
         """
+        chunks = iter(chunks)
+        added = 0
+        
+        # A single insert thread keeps batches in order and the collection
+        # touched by one thread at a time
+        with ThreadPoolExecutor(max_workers=1) as inserter:
+            pending = None
+            batch = list(islice(chunks, ADD_BATCH_SIZE))
+            while batch:
+                # Read ahead one batch to know whether this one is the last
+                following = list(islice(chunks, ADD_BATCH_SIZE))
+                records = self._prepare_batch(batch, document_id, file_hash)
+                if not following:
+                    records['metadatas'][-1]['index_complete'] = True
+                if pending is not None:
+                    pending.result()
+                pending = inserter.submit(self.collection.add, **records)
+                added += len(batch)
+                batch = following
+            if pending is not None:
+                pending.result()
+        
+        print(f"Added {added} chunks to vector store for document: {document_id}")
+        return added
+    
+    def _prepare_batch(self,
+                       chunks: List[DocumentChunk],
+                       document_id: str,
+                       file_hash: Optional[str]) -> Dict:
+        """Embed one batch of chunks and build the collection.add arguments"""
         texts = [chunk.text for chunk in chunks]
         
-        # Generate embeddings
-        embeddings = self.embed_fn(texts)
+        # Embed each distinct text once; repeated headers and boilerplate
+        # reuse the row of their first occurrence
+        unique_rows: Dict[str, int] = {}
+        rows = [unique_rows.setdefault(text, len(unique_rows)) for text in texts]
+        unique_embeddings = self.embed_fn(list(unique_rows))
+        embeddings = (
+            unique_embeddings if len(unique_rows) == len(texts)
+            else unique_embeddings[np.array(rows)]
+        )
         
         # Prepare metadata
-        metadatas = []
-        ids = []
-        
-        for i, chunk in enumerate(chunks):
-            chunk_id = f"{document_id}_chunk_{chunk.chunk_index}"
-            ids.append(chunk_id)
-            
-            metadatas.append({
+        ids = [f"{document_id}_chunk_{chunk.chunk_index}" for chunk in chunks]
+        # Numbers are stored natively so they can be used in range filters
+        metadatas = [
+            {
                 'document_id': document_id,
-                'page_number': str(chunk.page_number),
-                'chunk_index': str(chunk.chunk_index),
-                'char_count': str(chunk.metadata.get('char_count', 0))
-            })
+                'page_number': chunk.page_number,
+                'chunk_index': chunk.chunk_index,
+                'char_count': chunk.metadata.get('char_count', 0)
+            }
+            for chunk in chunks
+        ]
+        if file_hash is not None:
+            for metadata in metadatas:
+                metadata['file_hash'] = file_hash
         
-        # Add to collection
-        self.collection.add(
-            embeddings=embeddings.tolist(),
-            documents=texts,
-            metadatas=metadatas,
-            ids=ids
-        )
-        
-        print(f"Added {len(chunks)} chunks to vector store for document: {document_id}")
+        return {
+            'embeddings': embeddings,
+            'documents': texts,
+            'metadatas': metadatas,
+            'ids': ids
+        }
     
     def query(self, 
               query_text: str, 
@@ -167,11 +461,11 @@ class VectorStore:
             List of dicts with text, metadata, and similarity scores
         """
         # Generate query embedding
-        query_embedding = self.embed_fn([query_text])
+        query_embedding = self._embed_query(query_text)
         
         # Query collection
         results = self.collection.query(
-            query_embeddings=query_embedding.tolist(),
+            query_embeddings=query_embedding,
             n_results=n_results,
             where=filter_dict
         )
@@ -189,6 +483,34 @@ class VectorStore:
         
         return formatted_results
     
+    def _embed_query(self, query_text: str) -> np.ndarray:
+        """Embed a query, reusing the embedding of recently repeated queries"""
+        query_embedding = self._query_cache.get(query_text)
+        if query_embedding is None:
+            query_embedding = self.embed_fn([query_text])
+            query_embedding.flags.writeable = False  # shared between calls
+            self._query_cache[query_text] = query_embedding
+        return query_embedding
+    
+    def has_document(self, document_id: str, file_hash: Optional[str] = None) -> bool:
+        """
+        Check whether chunks for a document are already stored
+        
+        Args:
+            document_id: Unique identifier for the source document
+            file_hash: Only match a complete index of the file with this digest
+        """
+        where = {"document_id": document_id}
+        if file_hash is not None:
+            where = {"$and": [where, {"file_hash": file_hash}, {"index_complete": True}]}
+        
+        existing = self.collection.get(
+            where=where,
+            limit=1,
+            include=[]
+        )
+        return len(existing['ids']) > 0
+    
     def delete_document(self, document_id: str):
         """Delete all chunks for a specific document"""
         self.collection.delete(